@@ -0,0 +1,89 @@
+import re
+from typing import NamedTuple, Optional
+
+# Indian numbering units, in rupees
+UNIT_MULTIPLIERS = {
+    "crore": 1e7, "crores": 1e7, "cr": 1e7,
+    "lakh": 1e5, "lakhs": 1e5, "lac": 1e5, "lacs": 1e5, "l": 1e5,
+    "million": 1e6, "mn": 1e6, "m": 1e6,
+    "thousand": 1e3, "k": 1e3,
+}
+
+NUMBER = r"\d+(?:,\d+)*(?:\.\d+)?"
+UNIT = r"crores?|cr|lakhs?|lacs?|l|million|mn|m|thousand|k"
+
+# A trailing % means a rate, not an amount ("35%")
+AMOUNT_RE = re.compile(rf"(?<![\d.,])(?P<number>{NUMBER})\s*(?P<unit>{UNIT})?\b(?![.,\d]*\s*%)", re.IGNORECASE)
+
+CURRENCY_PREFIX_RE = re.compile(r"(?:₹|rs\.?|inr|\s)+$", re.IGNORECASE)
+CURRENCY_RE = re.compile(r"₹|\brs\b\.?|\binr\b", re.IGNORECASE)
+# What may sit between the two ends of a range: "10-12 Lakh", "₹10 L to ₹12 L", "between 5 and 7 Cr"
+RANGE_SEPARATOR_RE = re.compile(r"^\s*(?:-|–|—|to|and)\s*(?:₹|rs\.?|inr)?\s*$", re.IGNORECASE)
+
+MONTHLY_RE = re.compile(r"/\s*(?:month|mo|m)\b|\bper\s+month|\ba\s+month|\bmonthly|\bp\.?\s*m\.?(?!\w)", re.IGNORECASE)
+YEARLY_RE = re.compile(r"/\s*(?:year|yr|annum|y)\b|\bper\s+(?:year|annum)|\ba\s+year|\b(?:annual(?:ly)?|yearly)|\bp\.?\s*a\.?(?!\w)", re.IGNORECASE)
+
+
+class Amount(NamedTuple):
+    value: float # rupees; the midpoint for ranges
+    low: float
+    high: float
+    period: Optional[str] # "month" or "year" for recurring amounts (SIPs, premiums), None for a value
+
+    @property
+    def monthly(self) -> Optional[float]:
+        if self.period == "month":
+            return self.value
+        if self.period == "year":
+            return self.value / 12
+        return None
+
+
+def _rupees(match) -> float:
+    return float(match.group("number").replace(",", "")) * UNIT_MULTIPLIERS.get((match.group("unit") or "").lower(), 1)
+
+
+def _is_money(text: str, match) -> bool:
+    return bool(match.group("unit") or "," in match.group("number") or CURRENCY_RE.search(text[max(0, match.start() - 6):match.start()]))
+
+
+def parse_amount_detail(text) -> Optional[Amount]:
+    """Rupee value, range and recurrence of an LLM-produced amount string.
+
+    Handles "₹1.2 Cr", "45,00,000", "12 Lakh", "₹10-12 Lakh", "50K - 75K", "50,000/month", "₹6 L p.a.".
+    Numbers without a currency marker, unit or digit grouping ("10 years", "Age 45") are skipped.
+    """
+    if text is None or isinstance(text, bool):
+        return None
+    if isinstance(text, (int, float)):
+        return Amount(float(text), float(text), float(text), None)
+    text = str(text)
+    matches = list(AMOUNT_RE.finditer(text))
+    # The first number that something marks as money: "₹"/"Rs"/"INR" just before it, a unit
+    # ("12 Lakh", "50K") or digit grouping ("45,00,000"). "10 years" or "Age 45" is not an amount.
+    for i, first in enumerate(matches):
+        following = matches[i + 1] if i + 1 < len(matches) else None
+        second = following if following and RANGE_SEPARATOR_RE.match(text[first.end():following.start()]) else None
+        if _is_money(text, first) or (second and _is_money(text, second)):
+            break
+    else:
+        return None
+    low = high = _rupees(first)
+    if second:
+        if not first.group("unit") and second.group("unit"):
+            # "10-12 Lakh": the unit is written once, after the upper bound
+            low = float(first.group("number").replace(",", "")) * UNIT_MULTIPLIERS[second.group("unit").lower()]
+        high = _rupees(second)
+        if high < low:
+            low, high = high, low
+    # "-₹2,00,000" / "₹-2,00,000" (negative net worth)
+    if CURRENCY_PREFIX_RE.sub("", text[:first.start()]).endswith("-"):
+        low, high = -high, -low
+    period = "month" if MONTHLY_RE.search(text) else "year" if YEARLY_RE.search(text) else None
+    return Amount((low + high) / 2, low, high, period)
+
+
+def parse_amount(text) -> float | None:
+    """Best-effort rupee value of an LLM-produced amount string ("₹1.2 Cr", "45,00,000", "12 Lakh")."""
+    amount = parse_amount_detail(text)
+    return amount.value if amount else None
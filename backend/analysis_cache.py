@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from ttl_cache import TTLCache
+
+# Bump whenever the /analyze prompt, model or the way inputs are presented to it changes,
+# so stale results stop matching.
+# v2: text-layer PDF pages are sent as text and images are re-encoded before upload.
+# v3: incremental analyses use their own patch-only prompt.
+ANALYZE_PROMPT_VERSION = "analyze-v3"
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", os.path.join(BASE_DIR, "analysis_cache.db"))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", str(7 * 24 * 3600)))
+ANALYSIS_CACHE_MEMORY_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MEMORY_ENTRIES", "256"))
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_stream(stream) -> str:
+    """sha256 of a file-like object's bytes, read in chunks and rewound."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def analysis_key(model_name: str, file_hashes: list, transcript: str | None, context_version: str | None,
+                 input_settings: dict | None = None) -> str:
+    """Cache key over the normalized /analyze inputs.
+
+    file_hashes is a list of (filename, content_type, sha256) in upload order; order matters
+    because it is the order the parts are presented to the model. input_settings holds the
+    preprocessing knobs (image size/quality, PDF text threshold) that change what is sent for the same bytes.
+    """
+    material = {
+        "prompt": ANALYZE_PROMPT_VERSION,
+        "inputs": input_settings or {},
+        "model": model_name,
+        "context": context_version,
+        "transcript": (transcript or "").strip(),
+        "files": [[name.lower(), content_type or "", digest] for name, content_type, digest in file_hashes],
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """Two-tier result cache: in-process LRU in front of a SQLite table that survives restarts."""
+
+    def __init__(self, path: str = ANALYSIS_CACHE_PATH, ttl: float = ANALYSIS_CACHE_TTL,
+                 memory_entries: int = ANALYSIS_CACHE_MEMORY_ENTRIES, max_bytes: int = ANALYSIS_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory = TTLCache(maxsize=memory_entries, ttl=ttl)
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.writes = 0
+        self.disk_evictions = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_analysis_cache_accessed ON analysis_cache (accessed_at)")
+            self._conn.commit()
+        return self._conn
+
+    # --- Disk tier (blocking; called through asyncio.to_thread) ---
+    def _disk_get(self, key: str):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT value, created_at FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.disk_misses += 1
+                return None
+            value, created_at = row
+            if created_at + self.ttl <= now:
+                db.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                db.commit()
+                self.disk_misses += 1
+                return None
+            db.execute("UPDATE analysis_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            db.commit()
+            self.disk_hits += 1
+            return value
+
+    def _disk_put(self, key: str, value: str):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self.writes += 1
+            self._evict(db, now)
+            db.commit()
+
+    def _evict(self, db, now: float):
+        expired = db.execute("DELETE FROM analysis_cache WHERE created_at <= ?", (now - self.ttl,)).rowcount
+        self.disk_evictions += max(expired, 0)
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM analysis_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used rows until back under the byte budget
+        for key, size in db.execute("SELECT key, size FROM analysis_cache ORDER BY accessed_at").fetchall():
+            db.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+            self.disk_evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    # --- Public API ---
+    async def get(self, key: str):
+        value = self.memory.get(key)
+        if value is None:
+            value = await asyncio.to_thread(self._disk_get, key)
+            if value is None:
+                return None
+            self.memory.set(key, value)
+        return json.loads(value)
+
+    async def put(self, key: str, result: dict):
+        value = json.dumps(result)
+        self.memory.set(key, value)
+        await asyncio.to_thread(self._disk_put, key, value)
+
+    def stats(self) -> dict:
+        lookups = self.memory.hits + self.memory.misses
+        hits = self.memory.hits + self.disk_hits
+        return {
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory": self.memory.stats(),
+            "disk": {
+                "hits": self.disk_hits,
+                "misses": self.disk_misses,
+                "writes": self.writes,
+                "evictions": self.disk_evictions,
+            },
+        }
+
+
+analysis_cache = AnalysisCache()
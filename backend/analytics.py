@@ -0,0 +1,310 @@
+import re
+import threading
+from typing import Optional
+from sqlalchemy.orm import Session
+from models import ClientProfile, ProfileAsset, ProfileCategoryTotal, User
+
+# numpy is imported inside the methods that need it, so processes that never serve
+# analytics don't pay for it at startup.
+
+# Holdings are bucketed into these categories; the first keyword starting a word of "type description" wins.
+CATEGORIES = (
+    "SIP", "Mutual Fund", "Equity", "Debt", "Fixed Deposit", "Retirement",
+    "Gold & Jewellery", "Real Estate", "Insurance", "Cash", "Business", "Other",
+)
+# Whole words only (with their plurals), first match wins: "share" must not catch "shared", nor "land" "Landmark"
+CATEGORY_KEYWORDS = (
+    (r"sips?", "SIP"), (r"systematic", "SIP"),
+    (r"mutual", "Mutual Fund"), (r"mfs?", "Mutual Fund"), (r"elss", "Mutual Fund"),
+    (r"ppf", "Retirement"), (r"epf", "Retirement"), (r"nps", "Retirement"), (r"pensions?", "Retirement"), (r"provident", "Retirement"),
+    (r"fixed deposits?", "Fixed Deposit"), (r"fds?", "Fixed Deposit"), (r"deposits?", "Fixed Deposit"),
+    (r"stocks?", "Equity"), (r"shares?", "Equity"), (r"equity|equities", "Equity"), (r"esops?", "Equity"),
+    (r"bonds?", "Debt"), (r"debentures?", "Debt"), (r"debt", "Debt"),
+    (r"gold", "Gold & Jewellery"), (r"jewel+e?ry|jewels?", "Gold & Jewellery"), (r"silver", "Gold & Jewellery"),
+    (r"property|properties", "Real Estate"), (r"real estate", "Real Estate"), (r"flats?", "Real Estate"), (r"lands?", "Real Estate"),
+    (r"houses?", "Real Estate"), (r"apartments?", "Real Estate"), (r"plots?", "Real Estate"),
+    (r"ulips?", "Insurance"), (r"insurance", "Insurance"), (r"policy|policies", "Insurance"),
+    (r"cash", "Cash"), (r"savings?", "Cash"), (r"bank", "Cash"),
+    (r"business(?:es)?", "Business"), (r"firms?", "Business"),
+)
+CATEGORY_PATTERNS = [(re.compile(rf"\b(?:{pattern})\b"), category) for pattern, category in CATEGORY_KEYWORDS]
+CATEGORY_INDEX = {name: i for i, name in enumerate(CATEGORIES)}
+RANK_BUCKETS = 11 # 0 = unranked, 1-10
+
+
+def categorize(kind: Optional[str], description: Optional[str] = None) -> int:
+    words = re.sub(r"[^a-z0-9]+", " ", f"{kind or ''} {description or ''}".lower())
+    for pattern, category in CATEGORY_PATTERNS:
+        if pattern.search(words):
+            return CATEGORY_INDEX[category]
+    return CATEGORY_INDEX["Other"]
+
+
+def _share_stats(values) -> dict:
+    import numpy as np
+    total = float(values.sum())
+    if total <= 0:
+        return {"top_share": None, "hhi": None}
+    shares = np.sort(values)[::-1] / total
+    return {"top_share": round(float(shares[0]), 4), "hhi": round(float(np.square(shares).sum()), 4)}
+
+
+class BookAnalytics:
+    """Columnar, in-memory view of every client's holdings with running per-RM aggregates.
+
+    Each profile is a row: owner, rank, net worth and a vector of rupee holdings per CATEGORY
+    (values; monthly run-rate for SIPs). The per-RM totals are adjusted by the difference
+    whenever one profile changes, so dashboard queries never re-read or re-parse profiles.
+    Loaded from the structured profile tables on first use and kept current by profile_saved()
+    plus a cheap catch-up on updated_at for saves made by other worker processes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.watermark = None # newest profiles.updated_at applied
+        self.slots = {} # profile_id -> row
+        self.owner_rows = {} # owner_id -> row in the per-RM aggregates
+
+    def _allocate(self, profiles: int, owners: int):
+        import numpy as np
+        self.profile_ids = np.zeros(profiles, dtype=np.int64)
+        self.owner = np.full(profiles, -1, dtype=np.int32)
+        self.rank = np.zeros(profiles, dtype=np.int8)
+        self.net_worth = np.full(profiles, np.nan)
+        self.holdings = np.zeros((profiles, len(CATEGORIES))) # values; SIP column is monthly
+        self.aum_by_owner = np.zeros((owners, len(CATEGORIES)))
+        self.sip_clients_by_owner = np.zeros(owners, dtype=np.int64)
+        self.clients_by_owner = np.zeros(owners, dtype=np.int64)
+        self.ranks_by_owner = np.zeros((owners, RANK_BUCKETS), dtype=np.int64)
+
+    def _grow(self):
+        import numpy as np
+        if len(self.slots) >= len(self.owner):
+            extra = len(self.owner)
+            self.profile_ids = np.concatenate([self.profile_ids, np.zeros(extra, dtype=np.int64)])
+            self.owner = np.concatenate([self.owner, np.full(extra, -1, dtype=np.int32)])
+            self.rank = np.concatenate([self.rank, np.zeros(extra, dtype=np.int8)])
+            self.net_worth = np.concatenate([self.net_worth, np.full(extra, np.nan)])
+            self.holdings = np.vstack([self.holdings, np.zeros((extra, len(CATEGORIES)))])
+        if len(self.owner_rows) >= len(self.clients_by_owner):
+            extra = len(self.clients_by_owner)
+            self.aum_by_owner = np.vstack([self.aum_by_owner, np.zeros((extra, len(CATEGORIES)))])
+            self.sip_clients_by_owner = np.concatenate([self.sip_clients_by_owner, np.zeros(extra, dtype=np.int64)])
+            self.clients_by_owner = np.concatenate([self.clients_by_owner, np.zeros(extra, dtype=np.int64)])
+            self.ranks_by_owner = np.vstack([self.ranks_by_owner, np.zeros((extra, RANK_BUCKETS), dtype=np.int64)])
+
+    def _owner_row(self, owner_id) -> int:
+        row = self.owner_rows.get(owner_id)
+        if row is None:
+            self._grow()
+            row = self.owner_rows[owner_id] = len(self.owner_rows)
+        return row
+
+    def _remove(self, slot: int):
+        owner = self.owner[slot]
+        if owner < 0:
+            return
+        sip = CATEGORY_INDEX["SIP"]
+        self.aum_by_owner[owner] -= self.holdings[slot]
+        self.clients_by_owner[owner] -= 1
+        self.sip_clients_by_owner[owner] -= self.holdings[slot, sip] > 0
+        self.ranks_by_owner[owner, self.rank[slot]] -= 1
+
+    def _apply(self, profile_id: int, owner_id, rank, net_worth, rows):
+        """rows: (type, description, amount, period) holdings of one profile."""
+        import numpy as np
+        slot = self.slots.get(profile_id)
+        if slot is None:
+            self._grow()
+            slot = self.slots[profile_id] = len(self.slots)
+            self.profile_ids[slot] = profile_id
+        else:
+            self._remove(slot)
+        vector = np.zeros(len(CATEGORIES))
+        sip = CATEGORY_INDEX["SIP"]
+        for kind, description, amount, period in rows:
+            if amount is None or amount <= 0:
+                continue
+            category = categorize(kind, description)
+            if period == "month" or period == "year":
+                # Recurring flows aren't holdings; only SIP contributions are tracked, as a monthly run-rate
+                if category == sip:
+                    vector[sip] += amount if period == "month" else amount / 12
+            else:
+                # A SIP quoted as a value is the corpus built up so far
+                vector[CATEGORY_INDEX["Mutual Fund"] if category == sip else category] += amount
+        owner = self._owner_row(owner_id)
+        rank = rank if rank is not None and 1 <= rank <= 10 else 0
+        self.owner[slot] = owner
+        self.rank[slot] = rank
+        self.net_worth[slot] = np.nan if net_worth is None else net_worth
+        self.holdings[slot] = vector
+        self.aum_by_owner[owner] += vector
+        self.clients_by_owner[owner] += 1
+        self.sip_clients_by_owner[owner] += vector[sip] > 0
+        self.ranks_by_owner[owner, rank] += 1
+
+    # --- Loading ---
+    def _load_rows(self, db: Session, since=None):
+        query = db.query(
+            ClientProfile.id, ClientProfile.owner_id, ClientProfile.potential_rank,
+            ClientProfile.net_worth, ClientProfile.updated_at
+        )
+        if since is not None:
+            query = query.filter(ClientProfile.updated_at >= since)
+        profiles = query.all()
+        if not profiles:
+            return
+        ids = [p.id for p in profiles]
+        holdings = {profile_id: [] for profile_id in ids}
+        with_assets = set()
+        asset_query = db.query(ProfileAsset.profile_id, ProfileAsset.type, ProfileAsset.description, ProfileAsset.amount, ProfileAsset.period)
+        total_query = db.query(ProfileCategoryTotal.profile_id, ProfileCategoryTotal.type, ProfileCategoryTotal.amount, ProfileCategoryTotal.period)
+        if since is not None:
+            asset_query = asset_query.filter(ProfileAsset.profile_id.in_(ids))
+            total_query = total_query.filter(ProfileCategoryTotal.profile_id.in_(ids))
+        for profile_id, kind, description, amount, period in asset_query:
+            holdings[profile_id].append((kind, description, amount, period))
+            with_assets.add(profile_id)
+        for profile_id, kind, amount, period in total_query:
+            # Category totals only stand in when the model listed no individual assets
+            if profile_id not in with_assets:
+                holdings[profile_id].append((kind, None, amount, period))
+        for p in profiles:
+            self._apply(p.id, p.owner_id, p.potential_rank, p.net_worth, holdings[p.id])
+            if p.updated_at is not None and (self.watermark is None or p.updated_at > self.watermark):
+                self.watermark = p.updated_at
+
+    def sync(self, db: Session):
+        """Load on first use, then pick up profiles saved since the last call (e.g. by other workers)."""
+        with self.lock:
+            if not self.loaded:
+                count = db.query(ClientProfile.id).count()
+                self._allocate(max(64, count * 2), 16)
+                self._load_rows(db)
+                self.loaded = True
+            else:
+                self._load_rows(db, since=self.watermark)
+
+    def profile_saved(self, profile: ClientProfile):
+        """Fold one just-indexed profile into the aggregates (no-op until analytics is first used)."""
+        if not self.loaded:
+            return
+        assets = [(a.type, a.description, a.amount, a.period) for a in profile.assets]
+        if not assets:
+            assets = [(t.type, None, t.amount, t.period) for t in profile.category_totals]
+        with self.lock:
+            self._apply(profile.id, profile.owner_id, profile.potential_rank, profile.net_worth, assets)
+
+    # --- Queries ---
+    def _owners(self, db: Session, owner_rows: list) -> list:
+        """(owner_id, row, username) for an owner_rows snapshot taken under the lock with the arrays it indexes."""
+        owner_ids = [owner_id for owner_id, _ in owner_rows if owner_id is not None]
+        names = dict(db.query(User.id, User.username).filter(User.id.in_(owner_ids))) if owner_ids else {}
+        return [(owner_id, row, names.get(owner_id, "System")) for owner_id, row in owner_rows]
+
+    def aum(self, db: Session) -> dict:
+        import numpy as np
+        self.sync(db)
+        with self.lock:
+            # Saves on other threads add owners (and grow the arrays)
+            owner_rows = list(self.owner_rows.items())
+            holdings = self.aum_by_owner[:len(self.owner_rows)].copy()
+            clients = self.clients_by_owner[:len(self.owner_rows)].copy()
+        sip = CATEGORY_INDEX["SIP"]
+        holdings[:, sip] = 0 # SIP column is a monthly flow, reported by sip()
+        by_category = holdings.sum(axis=0)
+        return {
+            "total": round(float(by_category.sum()), 2),
+            "by_category": {CATEGORIES[i]: round(float(by_category[i]), 2) for i in np.flatnonzero(by_category)},
+            "by_rm": [
+                {
+                    "rm": name, "owner_id": owner_id, "clients": int(clients[row]),
+                    "aum": round(float(holdings[row].sum()), 2),
+                    "by_category": {CATEGORIES[i]: round(float(holdings[row, i]), 2) for i in np.flatnonzero(holdings[row])},
+                }
+                for owner_id, row, name in self._owners(db, owner_rows)
+            ],
+        }
+
+    def concentration(self, db: Session, top_clients: int = 5) -> dict:
+        import numpy as np
+        self.sync(db)
+        with self.lock:
+            owner_rows = list(self.owner_rows.items())
+            used = len(self.slots)
+            owner = self.owner[:used].copy()
+            totals = self.holdings[:used].sum(axis=1) - self.holdings[:used, CATEGORY_INDEX["SIP"]]
+            profile_ids = self.profile_ids[:used].copy()
+            by_category = self.aum_by_owner[:len(self.owner_rows)].copy()
+        by_category[:, CATEGORY_INDEX["SIP"]] = 0
+        result = []
+        for owner_id, row, name in self._owners(db, owner_rows):
+            client_values = totals[owner == row]
+            client_ids = profile_ids[owner == row]
+            category_stats = _share_stats(by_category[row])
+            client_stats = _share_stats(client_values)
+            aum = float(client_values.sum())
+            order = np.argsort(client_values)[::-1][:top_clients]
+            result.append({
+                "rm": name, "owner_id": owner_id, "aum": round(aum, 2),
+                "top_category": CATEGORIES[int(np.argmax(by_category[row]))] if aum > 0 else None,
+                "top_category_share": category_stats["top_share"],
+                "category_hhi": category_stats["hhi"],
+                f"top{top_clients}_client_share": round(float(client_values[order].sum()) / aum, 4) if aum > 0 else None,
+                "client_hhi": client_stats["hhi"],
+                "largest_clients": [
+                    {"profile_id": int(client_ids[i]), "aum": round(float(client_values[i]), 2)} for i in order if client_values[i] > 0
+                ],
+            })
+        return {"by_rm": result}
+
+    def sip(self, db: Session) -> dict:
+        self.sync(db)
+        sip = CATEGORY_INDEX["SIP"]
+        with self.lock:
+            owner_rows = list(self.owner_rows.items())
+            monthly = self.aum_by_owner[:len(self.owner_rows), sip].copy()
+            sip_clients = self.sip_clients_by_owner[:len(self.owner_rows)].copy()
+            clients = self.clients_by_owner[:len(self.owner_rows)].copy()
+        return {
+            "monthly": round(float(monthly.sum()), 2),
+            "annualized": round(float(monthly.sum()) * 12, 2),
+            "clients_with_sip": int(sip_clients.sum()),
+            "by_rm": [
+                {
+                    "rm": name, "owner_id": owner_id, "monthly": round(float(monthly[row]), 2),
+                    "clients_with_sip": int(sip_clients[row]), "clients": int(clients[row]),
+                    "average_per_sip_client": round(float(monthly[row]) / int(sip_clients[row]), 2) if sip_clients[row] else None,
+                }
+                for owner_id, row, name in self._owners(db, owner_rows)
+            ],
+        }
+
+    def ranks(self, db: Session) -> dict:
+        import numpy as np
+        self.sync(db)
+        with self.lock:
+            owner_rows = list(self.owner_rows.items())
+            counts = self.ranks_by_owner[:len(self.owner_rows)].copy()
+        buckets = np.arange(RANK_BUCKETS)
+
+        def distribution(row_counts) -> dict:
+            ranked = row_counts[1:].sum()
+            return {
+                "distribution": {str(rank): int(row_counts[rank]) for rank in range(1, RANK_BUCKETS)},
+                "unranked": int(row_counts[0]),
+                "mean_rank": round(float((row_counts * buckets).sum() / ranked), 2) if ranked else None,
+            }
+
+        return {
+            **distribution(counts.sum(axis=0)),
+            "by_rm": [
+                {"rm": name, "owner_id": owner_id, **distribution(counts[row])}
+                for owner_id, row, name in self._owners(db, owner_rows)
+            ],
+        }
+
+
+book_analytics = BookAnalytics()
@@ -0,0 +1,65 @@
+import os
+import zipfile
+import tempfile
+import posixpath
+from typing import NamedTuple
+from gemini_files import guess_mime_type
+from jobs import SPOOL_MAX_SIZE
+
+# Clients analysed at once inside one batch; provider semaphores still cap the model calls.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CLIENTS = int(os.getenv("BATCH_MAX_CLIENTS", "200"))
+BATCH_MAX_FILES_PER_CLIENT = int(os.getenv("BATCH_MAX_FILES_PER_CLIENT", "50"))
+# Guards against zip bombs: the sum of declared uncompressed sizes must stay under this.
+BATCH_MAX_UNCOMPRESSED_BYTES = int(os.getenv("BATCH_MAX_UNCOMPRESSED_MB", "2048")) * 1024 * 1024
+
+
+class BatchArchiveError(Exception):
+    pass
+
+
+class ClientBundle(NamedTuple):
+    """One client folder inside a batch archive."""
+    name: str
+    members: list # zipfile.ZipInfo
+
+
+def _skip(path: str) -> bool:
+    parts = path.split("/")
+    return parts[0] == "__MACOSX" or any(part.startswith(".") for part in parts)
+
+
+def list_bundles(archive: zipfile.ZipFile) -> list:
+    """Group archive members by top-level folder: Client A/statement.pdf, Client A/notes.txt, ..."""
+    bundles = {}
+    total = 0
+    for info in archive.infolist():
+        path = posixpath.normpath(info.filename.replace("\\", "/")).lstrip("/")
+        if info.is_dir() or _skip(path) or path.startswith(".."):
+            continue
+        folder, _, rest = path.partition("/")
+        if not rest:
+            raise BatchArchiveError(f"'{path}' is not inside a client folder")
+        total += info.file_size
+        if total > BATCH_MAX_UNCOMPRESSED_BYTES:
+            raise BatchArchiveError("Archive is too large once uncompressed")
+        bundles.setdefault(folder, []).append(info)
+    if not bundles:
+        raise BatchArchiveError("Archive contains no client folders")
+    if len(bundles) > BATCH_MAX_CLIENTS:
+        raise BatchArchiveError(f"Archive has {len(bundles)} client folders; the limit is {BATCH_MAX_CLIENTS}")
+    for name, members in bundles.items():
+        if len(members) > BATCH_MAX_FILES_PER_CLIENT:
+            raise BatchArchiveError(f"'{name}' has {len(members)} files; the limit is {BATCH_MAX_FILES_PER_CLIENT}")
+    return [ClientBundle(name, members) for name, members in sorted(bundles.items())]
+
+
+def extract_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo):
+    """(filename, content_type, spooled copy) for one archive member; the caller closes the stream."""
+    target = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    with archive.open(info) as source:
+        while chunk := source.read(1024 * 1024):
+            target.write(chunk)
+    target.seek(0)
+    filename = posixpath.basename(info.filename)
+    return filename, guess_mime_type(filename, None), target
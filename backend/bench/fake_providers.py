@@ -0,0 +1,258 @@
+"""Local stand-ins for the LLM providers, for benchmarking without spending tokens.
+
+One process serves:
+  * HTTP  - OpenAI/DashScope-compatible /v1/chat/completions and Anthropic /v1/messages
+            (plain and streaming)
+  * gRPC  - Gemini GenerateContent / StreamGenerateContent over TLS with a self-signed
+            certificate, which is what the async Gemini SDK speaks
+
+Latency, jitter, stream chunking and error rate are configurable, so the backend's own
+overhead can be measured in isolation. Usually started by run_bench.py.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import ipaddress
+import grpc
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from google.ai import generativelanguage_v1beta as glm
+
+GEMINI_SERVICE = "google.ai.generativelanguage.v1beta.GenerativeService"
+
+ANALYSIS_JSON = {
+    "client_profile": {"name": "Bench Client", "risk_tolerance": "Moderate", "life_stage": "Accumulation", "potential_rank": 7},
+    "client_personal_details": {"full_name": "Bench Client", "dob_or_age": "42", "occupation": "Engineer"},
+    "financial_snapshot": {"net_worth": "₹2.4 Cr", "monthly_burn": "₹1,20,000", "savings_rate": "35%", "total_assets_value": "₹2.9 Cr"},
+    "assets_detail": [
+        {"type": "Mutual Fund", "value": "₹45 Lakh", "description": "Equity funds"},
+        {"type": "Property", "value": "₹1.8 Cr", "description": "Primary residence"},
+    ],
+    "category_totals": [{"type": "Mutual Fund", "total_value": "₹45 Lakh"}],
+    "goals_detected": [{"goal": "Retirement", "timeline": "2045", "feasibility": "High"}],
+    "key_risks": ["Concentration in real estate"],
+    "insurance_analysis": {
+        "life_insurance": {"status": "Detected", "coverage_amount": "₹1 Cr", "is_sufficient": False, "gap_details": ""},
+        "health_insurance": {"status": "Not Found", "coverage_amount": "", "is_sufficient": False, "gap_details": ""},
+        "rm_suggestion": "Top up term cover",
+    },
+}
+
+
+class FakeConfig:
+    def __init__(self, args):
+        self.latency = args.latency_ms / 1000
+        self.jitter = args.jitter_ms / 1000
+        self.error_rate = args.error_rate
+        self.chunks = max(1, args.chunks)
+        self.chunk_delay = args.chunk_delay_ms / 1000
+        self.words = args.words
+        self.calls = 0
+        self.errors = 0
+
+    async def think(self) -> bool:
+        """Simulated time to first token; returns False when this call should fail."""
+        self.calls += 1
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return False
+        return True
+
+    def text(self) -> str:
+        return " ".join(f"word{i}" for i in range(self.words))
+
+    def pieces(self, text: str) -> list:
+        size = max(1, len(text) // self.chunks)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+# --- OpenAI / DashScope / Anthropic over HTTP ---
+def http_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    def health():
+        return {"calls": config.calls, "errors": config.errors}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        if not await config.think():
+            return JSONResponse({"error": {"message": "injected failure", "type": "server_error"}}, status_code=500)
+        text = config.text()
+        if not body.get("stream"):
+            return {
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": config.words, "total_tokens": 100 + config.words},
+            }
+
+        async def events():
+            for i, piece in enumerate(config.pieces(text)):
+                if i:
+                    await asyncio.sleep(config.chunk_delay)
+                chunk = {
+                    "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage = {"prompt_tokens": 100, "completion_tokens": config.words, "total_tokens": 100 + config.words}
+                chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": model, "choices": [], "usage": usage}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/messages")
+    async def messages(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        if not await config.think():
+            return JSONResponse({"type": "error", "error": {"type": "api_error", "message": "injected failure"}}, status_code=500)
+        text = config.text()
+        usage = {"input_tokens": 100, "output_tokens": config.words}
+        if not body.get("stream"):
+            return {
+                "id": "msg_bench", "type": "message", "role": "assistant", "model": model,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn", "stop_sequence": None, "usage": usage,
+            }
+
+        def event(name, payload):
+            return f"event: {name}\ndata: {json.dumps({'type': name, **payload})}\n\n"
+
+        async def events():
+            yield event("message_start", {"message": {
+                "id": "msg_bench", "type": "message", "role": "assistant", "model": model, "content": [],
+                "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": 100, "output_tokens": 0},
+            }})
+            yield event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+            for i, piece in enumerate(config.pieces(text)):
+                if i:
+                    await asyncio.sleep(config.chunk_delay)
+                yield event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": piece}})
+            yield event("content_block_stop", {"index": 0})
+            yield event("message_delta", {"delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": config.words}})
+            yield event("message_stop", {})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+# --- Gemini over gRPC ---
+def gemini_response(text: str) -> glm.GenerateContentResponse:
+    return glm.GenerateContentResponse(
+        candidates=[glm.Candidate(
+            index=0,
+            content=glm.Content(role="model", parts=[glm.Part(text=text)]),
+            finish_reason=glm.Candidate.FinishReason.STOP,
+        )],
+        usage_metadata=glm.GenerateContentResponse.UsageMetadata(prompt_token_count=100, candidates_token_count=50),
+    )
+
+def gemini_handler(config: FakeConfig) -> grpc.GenericRpcHandler:
+    def reply_text(request) -> str:
+        if request.generation_config.response_mime_type == "application/json":
+            return json.dumps(ANALYSIS_JSON)
+        return config.text()
+
+    async def generate_content(request, context):
+        if not await config.think():
+            await context.abort(grpc.StatusCode.UNAVAILABLE, "injected failure")
+        return gemini_response(reply_text(request))
+
+    async def stream_generate_content(request, context):
+        if not await config.think():
+            await context.abort(grpc.StatusCode.UNAVAILABLE, "injected failure")
+        for i, piece in enumerate(config.pieces(reply_text(request))):
+            if i:
+                await asyncio.sleep(config.chunk_delay)
+            yield gemini_response(piece)
+
+    return grpc.method_handlers_generic_handler(GEMINI_SERVICE, {
+        "GenerateContent": grpc.unary_unary_rpc_method_handler(
+            generate_content,
+            request_deserializer=glm.GenerateContentRequest.deserialize,
+            response_serializer=glm.GenerateContentResponse.serialize,
+        ),
+        "StreamGenerateContent": grpc.unary_stream_rpc_method_handler(
+            stream_generate_content,
+            request_deserializer=glm.GenerateContentRequest.deserialize,
+            response_serializer=glm.GenerateContentResponse.serialize,
+        ),
+    })
+
+def self_signed_certificate(cert_dir: str) -> tuple:
+    """Write a localhost certificate/key pair; the backend trusts it via GRPC_DEFAULT_SSL_ROOTS_FILE_PATH."""
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName("localhost"), x509.IPAddress(ipaddress.ip_address("127.0.0.1"))
+        ]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_pem = cert.public_bytes(serialization.Encoding.PEM)
+    key_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    os.makedirs(cert_dir, exist_ok=True)
+    with open(os.path.join(cert_dir, "fake_gemini.pem"), "wb") as f:
+        f.write(cert_pem)
+    return cert_pem, key_pem
+
+
+async def serve(args):
+    config = FakeConfig(args)
+    cert_pem, key_pem = self_signed_certificate(args.cert_dir)
+    grpc_server = grpc.aio.server()
+    grpc_server.add_generic_rpc_handlers([gemini_handler(config)])
+    grpc_server.add_secure_port(f"127.0.0.1:{args.grpc_port}", grpc.ssl_server_credentials([(key_pem, cert_pem)]))
+    await grpc_server.start()
+    http_server = uvicorn.Server(uvicorn.Config(http_app(config), host="127.0.0.1", port=args.http_port, log_level="warning"))
+    print(f"Fake providers: http://127.0.0.1:{args.http_port} grpc://localhost:{args.grpc_port}", flush=True)
+    try:
+        await http_server.serve()
+    finally:
+        await grpc_server.stop(grace=None)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--http-port", type=int, default=9100)
+    parser.add_argument("--grpc-port", type=int, default=9101)
+    parser.add_argument("--cert-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".certs"))
+    parser.add_argument("--latency-ms", type=float, default=300, help="time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls that fail (0-1)")
+    parser.add_argument("--chunks", type=int, default=8, help="stream chunks per reply")
+    parser.add_argument("--chunk-delay-ms", type=float, default=20)
+    parser.add_argument("--words", type=int, default=120, help="reply length")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        sys.exit(0)
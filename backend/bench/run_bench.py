@@ -0,0 +1,348 @@
+"""Offline load test for the WealthSync backend.
+
+Starts the fake providers and a backend instance on a throwaway database, drives the main
+endpoints at each concurrency level and writes p50/p95/p99 latency and throughput as JSON.
+
+    python bench/run_bench.py --concurrency 1,8,32 --requests 200
+    python bench/run_bench.py --scenarios chat,chat_stream --latency-ms 800 --error-rate 0.05
+    python bench/run_bench.py --compare bench/results/<earlier run>.json
+
+Pass --backend-url to benchmark a server that is already running (with its own providers).
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import asyncio
+import argparse
+import itertools
+import datetime
+import tempfile
+import subprocess
+import statistics
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+USERS = {"admin": "admin123", "employee1": "emp123"}
+SCENARIOS = ["login", "list_profiles", "get_profile", "save_profile", "chat", "chat_stream", "analyze"]
+CHAT_MODELS = {"gemini": "Gemini 2.5 Flash", "openai": "GPT-4o (Standard)", "anthropic": "Claude 3.5 Sonnet", "qwen": "Qwen Max"}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(values: list, q: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+async def wait_until_up(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=1)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+# --- Processes ---
+class Stack:
+    """Fake providers + backend on ephemeral ports with a scratch data directory."""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="wealthsync-bench-")
+        self.procs = []
+        self.http_port, self.grpc_port, self.backend_port = free_port(), free_port(), free_port()
+        self.backend_url = f"http://127.0.0.1:{self.backend_port}"
+
+    def _spawn(self, cmd, env, cwd, log_name):
+        log = open(os.path.join(self.workdir, log_name), "w")
+        proc = subprocess.Popen(cmd, env=env, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+        self.procs.append(proc)
+        return proc
+
+    async def start(self):
+        a = self.args
+        cert_dir = os.path.join(self.workdir, "certs")
+        self._spawn([
+            sys.executable, os.path.join(BENCH_DIR, "fake_providers.py"),
+            "--http-port", str(self.http_port), "--grpc-port", str(self.grpc_port), "--cert-dir", cert_dir,
+            "--latency-ms", str(a.latency_ms), "--jitter-ms", str(a.jitter_ms), "--error-rate", str(a.error_rate),
+            "--chunks", str(a.chunks), "--chunk-delay-ms", str(a.chunk_delay_ms),
+        ], os.environ.copy(), BENCH_DIR, "fake_providers.log")
+        await wait_until_up(f"http://127.0.0.1:{self.http_port}/health")
+
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{os.path.join(self.workdir, 'bench.db')}",
+            "ANALYSIS_CACHE_PATH": os.path.join(self.workdir, "analysis_cache.db"),
+            "GEMINI_API_KEY": "bench", "OPENAI_API_KEY": "bench", "ANTHROPIC_API_KEY": "bench", "QWEN_API_KEY": "bench",
+            "GEMINI_API_ENDPOINT": f"localhost:{self.grpc_port}",
+            "GRPC_DEFAULT_SSL_ROOTS_FILE_PATH": os.path.join(cert_dir, "fake_gemini.pem"),
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{self.http_port}/v1",
+            "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{self.http_port}",
+            "QWEN_BASE_URL": f"http://127.0.0.1:{self.http_port}/v1",
+            # Measure the requested model, not the router's hedges
+            "HEDGE_AFTER_SECONDS": os.getenv("HEDGE_AFTER_SECONDS", "0"),
+        }
+        self._spawn([
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.backend_port),
+            "--log-level", "warning", "--workers", str(a.workers),
+        ], env, BACKEND_DIR, "backend.log")
+        await wait_until_up(f"{self.backend_url}/docs", timeout=120)
+
+    def stop(self):
+        for proc in reversed(self.procs):
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if self.args.keep_logs:
+            print(f"Logs kept in {self.workdir}")
+        else:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# --- Scenarios ---
+class Bench:
+    def __init__(self, client: httpx.AsyncClient, args):
+        self.client = client
+        self.args = args
+        self.headers = {}
+        self.profile_ids = []
+        # Every save must change the document: unchanged saves are a no-op and skip the write path
+        self.revisions = itertools.count(1)
+
+    async def setup(self):
+        response = await self.client.post("/login", data={"username": "admin", "password": USERS["admin"]})
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        # A realistic book to page through and chat about
+        for i in range(self.args.profiles):
+            await self.save(f"Bench Client {i:04d}")
+        response = await self.client.get("/profiles", params={"limit": 200}, headers=self.headers)
+        response.raise_for_status()
+        self.profile_ids = [p["id"] for p in response.json()]
+
+    def profile_data(self, name: str, revision: int = 0) -> dict:
+        return {
+            "client_profile": {"name": name, "risk_tolerance": "Moderate", "potential_rank": 6},
+            "financial_snapshot": {"net_worth": "₹1.5 Cr", "monthly_burn": "₹90,000"},
+            "assets_detail": [{"type": "SIP", "value": "₹25,000/month", "description": f"Index fund {j}"} for j in range(10)],
+            "goals_detected": [{"goal": "Child education", "timeline": "2032", "feasibility": "Medium"}],
+            "meeting_analysis": {"transcript_summary": "Quarterly review. " * 40, "next_steps": [f"Follow-up call #{revision}"]},
+        }
+
+    async def save(self, name: str):
+        response = await self.client.post(
+            "/save_profile", json={"name": name, "data": self.profile_data(name)}, headers=self.headers
+        )
+        response.raise_for_status()
+
+    def profile_id(self, i: int) -> int:
+        return self.profile_ids[i % len(self.profile_ids)]
+
+    async def login(self, i):
+        username = list(USERS)[i % len(USERS)]
+        return await self.client.post("/login", data={"username": username, "password": USERS[username]})
+
+    async def list_profiles(self, i):
+        return await self.client.get("/profiles", params={"limit": 50}, headers=self.headers)
+
+    async def get_profile(self, i):
+        return await self.client.get(f"/profiles/{self.profile_id(i)}", headers=self.headers)
+
+    async def save_profile(self, i):
+        name = f"Bench Save {i % 50:02d}"
+        data = self.profile_data(name, revision=next(self.revisions))
+        return await self.client.post("/save_profile", json={"name": name, "data": data}, headers=self.headers)
+
+    def chat_body(self, i) -> dict:
+        return {"profile_id": self.profile_id(i), "message": f"Question {i}: how is the SIP allocation?", "model": CHAT_MODELS[self.args.chat_provider]}
+
+    async def chat(self, i):
+        return await self.client.post("/chat", json=self.chat_body(i), headers=self.headers)
+
+    async def chat_stream(self, i):
+        """Returns (response, seconds to first delta)."""
+        started = time.perf_counter()
+        first_delta = None
+        async with self.client.stream("POST", "/chat/stream", json=self.chat_body(i), headers=self.headers) as response:
+            async for line in response.aiter_lines():
+                if first_delta is None and line.startswith("data:") and '"delta"' in line:
+                    first_delta = time.perf_counter() - started
+                if line.startswith("event: error"):
+                    response.status_code = 599
+        return response, first_delta
+
+    async def analyze(self, i):
+        files = {"files": (f"notes_{i}.txt", f"Client {i} holds ₹{i} Lakh in fixed deposits.".encode(), "text/plain")}
+        # refresh bypasses the result cache so every call reaches the (fake) model
+        return await self.client.post(
+            "/analyze", params={"refresh": "true"}, data={"transcript": "RM: Let's review."}, files=files, headers=self.headers
+        )
+
+
+async def run_scenario(bench: Bench, name: str, concurrency: int, total: int) -> dict:
+    call = getattr(bench, name)
+    latencies, first_deltas, statuses = [], [], {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                result = await call(i)
+                response, first_delta = result if isinstance(result, tuple) else (result, None)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status, first_delta = type(e).__name__, None
+            latencies.append(time.perf_counter() - started)
+            if first_delta is not None:
+                first_deltas.append(first_delta)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ok = sum(count for status, count in statuses.items() if status.isdigit() and int(status) < 400)
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    result = {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": ok,
+        "errors": total - ok,
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 2) if elapsed else None,
+        "mean_ms": ms(statistics.fmean(latencies)) if latencies else None,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(max(latencies)) if latencies else None,
+    }
+    if first_deltas:
+        result["first_delta_p50_ms"] = ms(percentile(first_deltas, 0.50))
+        result["first_delta_p95_ms"] = ms(percentile(first_deltas, 0.95))
+    return result
+
+
+# --- Reporting ---
+def print_table(results: list):
+    print(f"{'scenario':<15}{'conc':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for r in results:
+        print(f"{r['scenario']:<15}{r['concurrency']:>6}{r['rps']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['errors']:>8}")
+
+def compare(results: list, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path} (negative latency change is better)")
+    print(f"{'scenario':<15}{'conc':>6}{'rps Δ%':>10}{'p50 Δ%':>10}{'p95 Δ%':>10}{'p99 Δ%':>10}")
+
+    def delta(new, old):
+        if not new or not old:
+            return "-"
+        return f"{(new - old) / old * 100:+.1f}"
+
+    for r in results:
+        old = baseline.get((r["scenario"], r["concurrency"]))
+        if old is None:
+            continue
+        print(f"{r['scenario']:<15}{r['concurrency']:>6}{delta(r['rps'], old['rps']):>10}"
+              f"{delta(r['p50_ms'], old['p50_ms']):>10}{delta(r['p95_ms'], old['p95_ms']):>10}{delta(r['p99_ms'], old['p99_ms']):>10}")
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+async def main(args):
+    stack = None
+    if not args.backend_url:
+        stack = Stack(args)
+        await stack.start()
+    base_url = args.backend_url or stack.backend_url
+    results = []
+    try:
+        limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            bench = Bench(client, args)
+            await bench.setup()
+            for name in args.scenarios:
+                for concurrency in args.concurrency:
+                    await run_scenario(bench, name, min(concurrency, 2), min(args.warmup, args.requests))
+                    result = await run_scenario(bench, name, concurrency, args.requests)
+                    results.append(result)
+                    print(f"{name} x{concurrency}: {result['rps']} req/s, p95 {result['p95_ms']} ms, {result['errors']} errors", flush=True)
+    finally:
+        if stack:
+            stack.stop()
+
+    report = {
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print()
+    print_table(results)
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline WealthSync load test")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), type=lambda s: s.split(","))
+    parser.add_argument("--concurrency", default="1,8,32", type=lambda s: [int(c) for c in s.split(",")])
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--profiles", type=int, default=100, help="profiles seeded before the run")
+    parser.add_argument("--chat-provider", choices=sorted(CHAT_MODELS), default="gemini")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--latency-ms", type=float, default=300, help="fake provider time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--chunks", type=int, default=8)
+    parser.add_argument("--chunk-delay-ms", type=float, default=20)
+    parser.add_argument("--backend-url", help="benchmark an already running backend instead")
+    parser.add_argument("--output", help="results JSON path (default bench/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results JSON to diff against")
+    parser.add_argument("--keep-logs", action="store_true")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,175 @@
+import os
+import asyncio
+import datetime
+from typing import NamedTuple, Optional
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from models import ChatSession, ChatMessage
+from prompt_cache import ChatContext
+from metrics import current_timings
+
+# Conversation history sent with each turn (summary + verbatim recent turns), in estimated tokens.
+# Past this the oldest turns are folded into the summary, so per-turn cost stays flat.
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "3000"))
+# Most recent messages kept verbatim when summarizing (at least the last exchange is always kept)
+CHAT_RECENT_MESSAGES = int(os.getenv("CHAT_RECENT_MESSAGES", "6"))
+CHAT_SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL", "gemini-2.5-flash")
+CHAT_SUMMARY_WORDS = int(os.getenv("CHAT_SUMMARY_WORDS", "400"))
+
+SUMMARY_INSTRUCTIONS = f"""
+You maintain the running summary of a conversation between a wealth manager and an AI assistant about one client.
+Merge the NEW TURNS into the EXISTING SUMMARY. Keep every figure, decision, recommendation, open question and
+stated client preference; drop pleasantries, repetition and anything superseded by a later turn.
+Use terse bullet points, at most {CHAT_SUMMARY_WORDS} words. Return only the updated summary.
+"""
+
+ROLE_LABELS = {"user": "Advisor", "assistant": "Assistant"}
+
+
+class ChatSessionNotFound(Exception):
+    pass
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def render_turns(turns) -> str:
+    return "\n\n".join(f"{ROLE_LABELS.get(role, role)}: {content}" for role, content in turns)
+
+
+class ChatHistory(NamedTuple):
+    summary: Optional[str]
+    turns: list # (role, content), oldest first
+
+    def prompt(self, message: str) -> str:
+        """The user turn sent to the model. History goes here, after the cached instructions + vault prefix."""
+        if not self.summary and not self.turns:
+            return message
+        parts = []
+        if self.summary:
+            parts.append(f"CONVERSATION SO FAR (summary):\n{self.summary}")
+        if self.turns:
+            parts.append(f"RECENT TURNS:\n{render_turns(self.turns)}")
+        parts.append(f"CURRENT QUESTION:\n{message}")
+        return "\n\n".join(parts)
+
+
+class ChatSessionStore:
+    """Server-side chat sessions with a rolling summary kept within CHAT_HISTORY_TOKENS."""
+
+    def __init__(self, router):
+        self.router = router
+        self._summarizing = {}
+
+    async def open(self, db: AsyncSession, session_id: int, profile_id: Optional[int], user_id: int) -> ChatSession:
+        """The caller's existing session. New sessions are only created by record(), once there is a reply."""
+        session = await db.get(ChatSession, session_id)
+        if session is None or session.user_id != user_id or (profile_id is not None and session.profile_id != profile_id):
+            raise ChatSessionNotFound(session_id)
+        return session
+
+    async def history(self, db: AsyncSession, session: ChatSession) -> ChatHistory:
+        """Summary plus the newest unsummarized turns that fit the budget."""
+        budget = CHAT_HISTORY_TOKENS - estimate_tokens(session.summary or "")
+        rows = (await db.execute(
+            select(ChatMessage.role, ChatMessage.content, ChatMessage.tokens)
+            .where(ChatMessage.session_id == session.id, ChatMessage.id > (session.summarized_through or 0))
+            .order_by(ChatMessage.id.desc())
+            .limit(CHAT_RECENT_MESSAGES * 4)
+        )).all()
+        turns = []
+        for role, content, tokens in rows:
+            budget -= tokens or estimate_tokens(content)
+            if budget < 0:
+                # Older turns are already being folded into the summary
+                break
+            turns.append((role, content))
+        turns.reverse()
+        return ChatHistory(session.summary, turns)
+
+    async def record(self, session_id: Optional[int], profile_id: int, user_id: int,
+                     message: str, reply: str, model: Optional[str]) -> Optional[int]:
+        """Store one exchange, starting the session on its first reply; returns the session id.
+
+        Summarizing starts in the background if the history is over budget.
+        """
+        async with AsyncSessionLocal() as db:
+            if session_id is None:
+                session = ChatSession(profile_id=profile_id, user_id=user_id, summarized_through=0)
+                db.add(session)
+                await db.flush()
+                session_id = session.id
+            else:
+                session = await db.get(ChatSession, session_id)
+                if session is None:
+                    # Deleted while the reply was being generated
+                    return None
+                session.updated_at = datetime.datetime.utcnow()
+            db.add_all([
+                ChatMessage(session_id=session_id, role="user", content=message, tokens=estimate_tokens(message)),
+                ChatMessage(session_id=session_id, role="assistant", content=reply, tokens=estimate_tokens(reply), model=model),
+            ])
+            await db.commit()
+            pending = (await db.execute(
+                select(func.sum(ChatMessage.tokens))
+                .where(ChatMessage.session_id == session_id, ChatMessage.id > (session.summarized_through or 0))
+            )).scalar() or 0
+            total = pending + estimate_tokens(session.summary or "")
+        if total > CHAT_HISTORY_TOKENS:
+            self.schedule_summary(session_id)
+        return session_id
+
+    def schedule_summary(self, session_id: int):
+        if session_id in self._summarizing:
+            return
+        task = asyncio.ensure_future(self._summarize(session_id))
+        self._summarizing[session_id] = task
+        task.add_done_callback(lambda _: self._summarizing.pop(session_id, None))
+
+    async def _summarize(self, session_id: int):
+        # Not part of the request that triggered it
+        current_timings.set(None)
+        try:
+            async with AsyncSessionLocal() as db:
+                session = await db.get(ChatSession, session_id)
+                if session is None:
+                    return
+                summary, through = session.summary, session.summarized_through or 0
+                rows = (await db.execute(
+                    select(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.tokens)
+                    .where(ChatMessage.session_id == session_id, ChatMessage.id > through)
+                    .order_by(ChatMessage.id)
+                )).all()
+            # Keep the newest messages verbatim (up to half the budget), fold everything older
+            keep, kept_tokens = 0, 0
+            for _, _, content, tokens in reversed(rows):
+                tokens = tokens or estimate_tokens(content)
+                if keep >= 2 and (keep >= CHAT_RECENT_MESSAGES or kept_tokens + tokens > CHAT_HISTORY_TOKENS // 2):
+                    break
+                keep += 1
+                kept_tokens += tokens
+            if keep < len(rows) and rows[len(rows) - keep][1] == "assistant":
+                # Don't separate an answer from its question
+                keep += 1
+            fold = rows[:len(rows) - keep]
+            if not fold:
+                return
+            prompt = f"EXISTING SUMMARY:\n{summary or '(none yet)'}\n\nNEW TURNS:\n{render_turns((role, content) for _, role, content, _ in fold)}"
+            context = ChatContext(instructions=SUMMARY_INSTRUCTIONS, vault="", tools=False)
+            new_summary, _ = await self.router.complete(CHAT_SUMMARY_MODEL, context, prompt)
+            async with AsyncSessionLocal() as db:
+                # Only advance from the state we summarized; a concurrent run may have got there first
+                await db.execute(
+                    update(ChatSession)
+                    .where(ChatSession.id == session_id, ChatSession.summarized_through == through)
+                    .values(summary=new_summary.strip(), summarized_through=fold[-1][0])
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"Chat summary failed for session {session_id}: {e}")
+
+    async def stop(self):
+        if self._summarizing:
+            await asyncio.gather(*self._summarizing.values(), return_exceptions=True)
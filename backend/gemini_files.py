@@ -0,0 +1,81 @@
+import os
+import asyncio
+import datetime
+import mimetypes
+from sdk import gemini
+from ttl_cache import TTLCache
+
+# Gemini keeps File API uploads for 48h; stop reusing a handle a little before that.
+REMOTE_FILE_TTL = float(os.getenv("GEMINI_FILE_TTL", str(46 * 3600)))
+REMOTE_FILE_MARGIN = 15 * 60
+UPLOAD_CONCURRENCY = int(os.getenv("GEMINI_UPLOAD_CONCURRENCY", "4"))
+
+
+def guess_mime_type(filename: str, content_type: str | None) -> str:
+    if content_type and content_type != "application/octet-stream":
+        return content_type
+    guessed, _ = mimetypes.guess_type(filename)
+    if guessed:
+        return guessed
+    # Fallback by hint if neither the browser nor the extension tells us
+    content_type = content_type or ""
+    if "pdf" in content_type:
+        return "application/pdf"
+    if "audio" in content_type:
+        return "audio/mpeg"
+    if "video" in content_type:
+        return "video/mp4"
+    return "application/octet-stream"
+
+
+class RemoteFileRegistry:
+    """Uploads files to the Gemini File API with bounded concurrency.
+
+    Handles are remembered by content hash, so the same statement uploaded again
+    (another analysis, a retry, a second client) reuses the remote file while it is
+    still valid. Concurrent uploads of identical bytes share one in-flight upload.
+    """
+
+    def __init__(self, concurrency: int = UPLOAD_CONCURRENCY, maxsize: int = 2048):
+        self.handles = TTLCache(maxsize=maxsize, ttl=REMOTE_FILE_TTL)
+        self.uploads = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight = {}
+
+    def _ttl_for(self, remote_file) -> float:
+        expires = getattr(remote_file, "expiration_time", None)
+        if not expires:
+            return REMOTE_FILE_TTL
+        remaining = (expires - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        return max(0.0, min(REMOTE_FILE_TTL, remaining - REMOTE_FILE_MARGIN))
+
+    async def upload(self, stream, digest: str, mime_type: str, display_name: str):
+        handle = self.handles.get(digest)
+        if handle is not None:
+            return handle
+        task = self._inflight.get(digest)
+        if task is None:
+            task = asyncio.ensure_future(self._upload(stream, digest, mime_type, display_name))
+            self._inflight[digest] = task
+            task.add_done_callback(lambda _: self._inflight.pop(digest, None))
+        return await asyncio.shield(task)
+
+    async def _upload(self, stream, digest, mime_type, display_name):
+        async with self._semaphore:
+            stream.seek(0)
+            # Stream straight from the spooled upload; no temp-file copy
+            remote_file = await asyncio.to_thread(
+                gemini().upload_file, stream, mime_type=mime_type, display_name=display_name
+            )
+        self.uploads += 1
+        self.handles.set(digest, remote_file, ttl=self._ttl_for(remote_file))
+        return remote_file
+
+    def forget(self, digest: str):
+        self.handles.pop(digest)
+
+    def stats(self) -> dict:
+        return {**self.handles.stats(), "uploads": self.uploads, "in_flight": len(self._inflight)}
+
+
+remote_files = RemoteFileRegistry()
@@ -0,0 +1,124 @@
+import io
+import os
+import asyncio
+from typing import NamedTuple, Optional
+from ttl_cache import TTLCache
+from workers import ProcessPool, preprocess_pool
+
+# Resolution/cost trade-off for images sent to the model: (pixel budget, JPEG quality).
+# Gemini bills images in 768px tiles, so beyond ~3 MP extra pixels mostly add cost.
+IMAGE_QUALITY_PROFILES = {
+    "economy": (768 * 768, 75),
+    "balanced": (1536 * 1024, 85),
+    "detailed": (2048 * 1536, 90),
+}
+IMAGE_QUALITY_PROFILE = os.getenv("IMAGE_QUALITY_PROFILE", "balanced")
+_profile_pixels, _profile_quality = IMAGE_QUALITY_PROFILES.get(IMAGE_QUALITY_PROFILE, IMAGE_QUALITY_PROFILES["balanced"])
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(_profile_pixels)))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", str(_profile_quality)))
+# Two shots whose 64-bit difference hashes differ in at most this many bits count as the same board.
+IMAGE_DUPLICATE_DISTANCE = int(os.getenv("IMAGE_DUPLICATE_DISTANCE", "6"))
+IMAGE_CACHE_ENTRIES = int(os.getenv("IMAGE_CACHE_ENTRIES", "128"))
+IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", str(24 * 3600)))
+
+
+class PreparedImage(NamedTuple):
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    dhash: int
+    original_bytes: int
+
+    def blob(self) -> dict:
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+def difference_hash(image) -> int:
+    """64-bit dHash: brightness gradients of a 9x8 greyscale thumbnail."""
+    from PIL import Image
+    small = image.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def prepare_image(data: bytes, max_pixels: int, quality: int) -> PreparedImage:
+    """Runs in a worker process: orient, downscale to the pixel budget, re-encode as JPEG."""
+    # Imported here so only the worker processes load Pillow
+    from PIL import Image, ImageOps
+    image = Image.open(io.BytesIO(data))
+    scale = (max_pixels / (image.width * image.height)) ** 0.5
+    if scale < 1 and image.format == "JPEG":
+        # Let the JPEG decoder skip detail we are about to throw away (much faster on 12 MP photos)
+        image.draft("RGB", (int(image.width * scale), int(image.height * scale)))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    scale = (max_pixels / (image.width * image.height)) ** 0.5
+    if scale < 1:
+        image = image.resize(
+            (max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.Resampling.LANCZOS
+        )
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return PreparedImage(buffer.getvalue(), "image/jpeg", image.width, image.height, difference_hash(image), len(data))
+
+
+class ImagePreprocessor:
+    """Normalises uploaded images on the preprocessing pool; results cached by content hash."""
+
+    def __init__(self, pool: ProcessPool = preprocess_pool):
+        self.pool = pool
+        self.cache = TTLCache(maxsize=IMAGE_CACHE_ENTRIES, ttl=IMAGE_CACHE_TTL)
+        self.failures = 0
+
+    async def prepare(self, stream, digest: str) -> Optional[PreparedImage]:
+        """The normalised image, or None if Pillow can't decode it."""
+        prepared = self.cache.get(digest)
+        if prepared is not None:
+            return prepared
+        stream.seek(0)
+        data = await asyncio.to_thread(stream.read)
+        stream.seek(0)
+        try:
+            prepared = await self.pool.run(prepare_image, data, IMAGE_MAX_PIXELS, IMAGE_JPEG_QUALITY)
+        except Exception as e:
+            print(f"Image preprocessing failed: {e}")
+            self.failures += 1
+            return None
+        self.cache.set(digest, prepared)
+        return prepared
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "failures": self.failures, "profile": IMAGE_QUALITY_PROFILE}
+
+
+def find_duplicates(images: list) -> dict:
+    """{index: index of the earlier near-identical image} for a list of PreparedImage (None entries ignored)."""
+    duplicates = {}
+    kept = []
+    for i, image in enumerate(images):
+        if image is None:
+            continue
+        match = next((j for j in kept if hamming(images[j].dhash, image.dhash) <= IMAGE_DUPLICATE_DISTANCE), None)
+        if match is None:
+            kept.append(i)
+        else:
+            duplicates[i] = match
+    return duplicates
+
+
+image_preprocessor = ImagePreprocessor()
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import socket
+import asyncio
+import tempfile
+import traceback
+from typing import NamedTuple, Optional
+from sqlalchemy import update, delete
+from database import AsyncSessionLocal
+from models import AnalysisJob
+
+ANALYZE_WORKERS = int(os.getenv("ANALYZE_WORKERS", "2"))
+ANALYZE_QUEUE_SIZE = int(os.getenv("ANALYZE_QUEUE_SIZE", "100"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(6 * 3600)))
+# How often a process marks its unfinished jobs as alive. A queued/running job whose
+# heartbeat is older than three intervals belonged to a process that died or restarted.
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+SPOOL_MAX_SIZE = 1024 * 1024
+
+# Identifies this process in analysis_jobs.worker
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def spool_copy(source) -> tempfile.SpooledTemporaryFile:
+    """Copy a file-like object into a spooled temp file owned by the caller (memory up to 1 MB, then disk)."""
+    target = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    source.seek(0)
+    shutil.copyfileobj(source, target)
+    target.seek(0)
+    return target
+
+
+class Job:
+    def __init__(self, work, owner_id: int, kind: str, stages: list, on_change=None):
+        self.id = uuid.uuid4().hex
+        self.work = work
+        self.owner_id = owner_id
+        self.kind = kind
+        self.stages = stages
+        self.state = "queued"
+        self.stage = None
+        self.stage_started = {}
+        self.detail = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.on_change = on_change
+        # Serializes this job's writes so they land in the order they were made
+        self.write_lock = asyncio.Lock()
+
+    def enter_stage(self, name: str, detail: str | None = None):
+        self.stage = name
+        self.detail = detail
+        self.stage_started.setdefault(name, time.time())
+        if self.on_change:
+            self.on_change(self)
+
+    def status(self) -> dict:
+        done = self.state in ("succeeded", "failed")
+        if done:
+            progress = 1.0
+        elif self.stage in self.stages:
+            progress = self.stages.index(self.stage) / len(self.stages)
+        else:
+            progress = 0.0
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.state,
+            "stage": self.stage,
+            "detail": self.detail,
+            "progress": round(progress, 2),
+            "stages": [
+                {"name": name, "started_at": self.stage_started.get(name)} for name in self.stages
+            ],
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobRecord(NamedTuple):
+    """A job as stored, as seen by whichever worker the poll landed on."""
+    owner_id: int
+    state: str
+    status: dict
+    result: Optional[str] # JSON text, served as is
+
+    @property
+    def error(self) -> Optional[str]:
+        return self.status.get("error")
+
+
+class JobQueue:
+    """Job queue drained by a fixed number of asyncio workers in this process.
+
+    Jobs are coroutines; blocking steps inside them are already pushed to threads,
+    so a worker only holds a queue slot, never the event loop. Status and results are
+    written to the analysis_jobs table, so with several uvicorn workers any of them can
+    answer a poll, and finished jobs survive a restart.
+    """
+
+    def __init__(self, workers: int = ANALYZE_WORKERS, maxsize: int = ANALYZE_QUEUE_SIZE):
+        self.worker_count = workers
+        self.maxsize = maxsize
+        self.jobs = {} # unfinished jobs of this process
+        self._queue = None
+        self._workers = []
+        self._writes = set()
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        self._workers.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    async def submit(self, work, owner_id: int, kind: str, stages: list) -> Job:
+        job = Job(work, owner_id, kind, stages, on_change=self._save_soon)
+        # Held until the row exists, so a worker picking the job up can't write before it
+        async with job.write_lock:
+            try:
+                self._queue.put_nowait(job)
+            except asyncio.QueueFull:
+                raise JobQueueFull()
+            self.jobs[job.id] = job
+            async with AsyncSessionLocal() as db:
+                db.add(AnalysisJob(
+                    id=job.id, owner_id=owner_id, kind=kind, state=job.state, status=json.dumps(job.status()),
+                    worker=WORKER_ID, heartbeat_at=time.time(),
+                ))
+                await db.commit()
+        return job
+
+    async def get(self, job_id: str) -> Optional[JobRecord]:
+        async with AsyncSessionLocal() as db:
+            row = await db.get(AnalysisJob, job_id)
+        if row is None:
+            return None
+        status = json.loads(row.status)
+        if row.finished_at is None and (row.heartbeat_at or 0) < time.time() - 3 * JOB_HEARTBEAT_SECONDS:
+            status.update(status="failed", error="Interrupted: the server process running this job stopped", progress=1.0)
+        return JobRecord(row.owner_id, status["status"], status, row.result)
+
+    # --- Persistence ---
+    async def _save(self, job: Job):
+        async with job.write_lock:
+            values = {"state": job.state, "status": json.dumps(job.status()), "heartbeat_at": time.time()}
+            if job.finished_at is not None:
+                values["finished_at"] = job.finished_at
+                if job.state == "succeeded":
+                    values["result"] = json.dumps(job.result, default=str)
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(AnalysisJob).where(AnalysisJob.id == job.id).values(**values))
+                await db.commit()
+
+    def _save_soon(self, job: Job):
+        # Stage changes are reported from sync callbacks; the write happens in the background
+        task = asyncio.ensure_future(self._save(job))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                now = time.time()
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(AnalysisJob)
+                        .where(AnalysisJob.worker == WORKER_ID, AnalysisJob.finished_at.is_(None))
+                        .values(heartbeat_at=now)
+                    )
+                    await db.execute(delete(AnalysisJob).where(AnalysisJob.finished_at < now - JOB_RETENTION_SECONDS))
+                    await db.commit()
+            except Exception as e:
+                print(f"Jobs: heartbeat failed: {e}")
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.state = "running"
+            job.started_at = time.time()
+            self._save_soon(job)
+            try:
+                job.result = await job.work(job)
+                job.state = "succeeded"
+            except asyncio.CancelledError:
+                job.state = "failed"
+                job.error = "Cancelled"
+                raise
+            except Exception as e:
+                traceback.print_exc()
+                job.state = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                job.work = None
+                self.jobs.pop(job.id, None)
+                self._save_soon(job)
+                self._queue.task_done()
+
+
+analysis_jobs = JobQueue()
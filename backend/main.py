@@ -1,24 +1,54 @@
+import time
+IMPORT_STARTED = time.perf_counter()
 import os
 import io
 import json
-import tempfile
+import base64
+import hashlib
+import asyncio
 import datetime
-from typing import List, Optional
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Depends, status, Form, Query
+import zipfile
+from typing import List, Optional, NamedTuple, BinaryIO, Callable
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Depends, status, Form, Query, Request, Response, BackgroundTasks
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pypdf import PdfReader
-from PIL import Image
-import google.generativeai as genai
-import openai
-import anthropic
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from sqlalchemy import select, update, func, or_, and_
+from sqlalchemy.orm import Session, load_only, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from pydantic import BaseModel
+from providers import providers, resolve_model, provider_for, ProviderKeyMissing
+from router import ModelRouter
+from prompt_cache import prompt_cache, ChatContext
+from chat_sessions import ChatSessionStore, ChatSessionNotFound
+from analysis_cache import analysis_cache, analysis_key, hash_stream
+from jobs import analysis_jobs, Job, JobRecord, JobQueueFull, spool_copy
+from gemini_files import remote_files, guess_mime_type
+from workers import preprocess_pool
+from pdf_text import pdf_preprocessor, PDF_MIN_PAGE_CHARS
+from images import (
+    image_preprocessor, find_duplicates, IMAGE_QUALITY_PROFILE, IMAGE_MAX_PIXELS, IMAGE_JPEG_QUALITY, IMAGE_DUPLICATE_DISTANCE
+)
+from batch import BATCH_CONCURRENCY, BatchArchiveError, list_bundles, extract_member
+from database import engine, async_engine, SessionLocal, get_db, get_async_db
+from models import User, ClientProfile, ProfileAsset, ProfileVersion, ChatSession, ChatMessage
+from versions import record_version, load_version, make_patch, merge_patch, VersionNotFound
+from profile_index import index_profile
+from search_index import update_search_index, search_profiles
+from profile_payloads import profile_payloads, ProfilePayload, profile_etag, not_modified, http_date
+from analytics import book_analytics
+from migrations import upgrade_schema
+from metrics import (
+    MetricsMiddleware, METRICS_TOKEN, METRICS_PUBLIC, registry, span, StageTimer, instrument_engine, cache_collector,
+    startup_phases, startup_phase, pdf_pages, pdf_upload_bytes_saved, image_bytes, image_duplicates
+)
+import sdk
+from security import (
+    Principal, principal_cache, principal_from_user, get_password_hash, verify_password_async
+)
 
 load_dotenv()
 
@@ -26,41 +56,11 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-for-jwt-change-it-in-prod")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 # 1 day
-
-# --- Database Setup ---
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-db_path = os.path.join(BASE_DIR, "wealthsync.db")
-DATABASE_URL = f"sqlite:///{db_path}"
-
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+ANALYZE_MODEL = "gemini-2.0-flash"
 
 # --- Auth Context ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-# --- Models ---
-class User(Base):
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, index=True)
-    hashed_password = Column(String)
-    role = Column(String, default="employee") # admin or employee
-    profiles = relationship("ClientProfile", back_populates="owner")
-
-class ClientProfile(Base):
-    __tablename__ = "profiles"
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
-    data = Column(Text) # JSON stored as string
-    owner_id = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
-    owner = relationship("User", back_populates="profiles")
-
-Base.metadata.create_all(bind=engine)
-
 # --- Schemas ---
 class Token(BaseModel):
     access_token: str
@@ -77,16 +77,38 @@ class UserOut(BaseModel):
     role: str
 
 # --- Gemini Setup ---
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("GEMINI_API_KEY not found in environment variables")
-genai.configure(api_key=api_key)
+# Gemini is optional at import time (local runs, benchmarks); Gemini calls fail until a key is set.
+if not os.getenv("GEMINI_API_KEY"):
+    print("Warning: GEMINI_API_KEY not found in environment variables; Gemini models are unavailable")
 
 app = FastAPI(title="WealthSync API v3 - Auth & RBAC")
+model_router = ModelRouter(providers)
+chat_sessions = ChatSessionStore(model_router)
 
 @app.on_event("startup")
 async def startup_event():
-    seed_data()
+    print("Railway: Running startup sequence...")
+    # Workers fork first, before anything opens sockets or threads
+    with startup_phase("workers"):
+        preprocess_pool.start()
+        analysis_jobs.start()
+    # Creates tables, adds new columns, backfills structured profile fields and seeds users;
+    # a single query when the database is already current
+    with startup_phase("migrate"):
+        migrated = upgrade_schema(engine, SessionLocal, seed=seed_data)
+    # Only records which keys are set; SDKs and clients load on first use
+    with startup_phase("providers"):
+        providers.startup()
+    startup_phases["ready"] = time.perf_counter() - IMPORT_STARTED
+    report = ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in startup_phases.items())
+    print(f"Railway: Startup complete ({'migrated' if migrated else 'schema current'}): {report}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await analysis_jobs.stop()
+    preprocess_pool.shutdown()
+    await chat_sessions.stop()
+    await providers.shutdown()
 
 app.add_middleware(
     CORSMiddleware,
@@ -94,22 +116,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Server-Timing"],
 )
+app.add_middleware(MetricsMiddleware)
 
-# --- Utilities ---
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# --- Metrics ---
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+@registry.collector
+def collect_sdk_imports():
+    lines = ["# HELP wealthsync_sdk_import_seconds Time this process spent importing each provider SDK", "# TYPE wealthsync_sdk_import_seconds gauge"]
+    lines.extend(f'wealthsync_sdk_import_seconds{{module="{name}"}} {seconds:.6f}' for name, seconds in sdk.import_seconds.items())
+    return lines
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+cache_collector({
+    "principal": principal_cache.stats,
+    "analysis": analysis_cache.stats,
+    "gemini_files": remote_files.stats,
+    "gemini_prompt": prompt_cache.stats,
+    "pdf_text": pdf_preprocessor.stats,
+    "images": image_preprocessor.stats,
+    "profile_payload": profile_payloads.stats,
+})
 
+# --- Utilities ---
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.datetime.utcnow() + datetime.timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -117,7 +148,7 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -131,27 +162,24 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.username == token_data.username).first()
+    # Most requests are answered from the principal cache without touching the database
+    principal = principal_cache.get(token_data.username)
+    if principal is not None:
+        return principal
+    with span("auth_lookup"):
+        user = (await db.execute(select(User).where(User.username == token_data.username))).scalars().first()
     if user is None:
         raise credentials_exception
-    return user
-
-def extract_pdf_text(file_content: bytes) -> str:
-    try:
-        reader = PdfReader(io.BytesIO(file_content))
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        print(f"Error extracting PDF: {e}")
-        return ""
+    principal = principal_from_user(user)
+    principal_cache.set(user.username, principal)
+    return principal
 
 # --- Auth Routes ---
 @app.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = (await db.execute(select(User).where(User.username == form_data.username))).scalars().first()
+    # bcrypt runs on a bounded thread pool so logins never stall the event loop
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -161,171 +189,484 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     return {"access_token": access_token, "token_type": "bearer", "role": user.role, "username": user.username}
 
 # --- Data Routes ---
+PROFILE_LIST_SORTS = {
+    "updated_at": ClientProfile.updated_at,
+    "name": func.coalesce(ClientProfile.name, ""),
+    "id": ClientProfile.id,
+}
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode("utf-8")).decode("ascii")
+
+# Type of the cursor's sort value per sort key (updated_at travels as an ISO string)
+CURSOR_VALUE_TYPES = {"updated_at": str, "name": str, "id": int}
+
+def decode_cursor(cursor: str, sort: str) -> tuple:
+    """(last sort value, last id) from an X-Next-Cursor token; 400 for anything we didn't issue."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(values, list) or len(values) != 2:
+            raise ValueError("cursor must be a pair")
+        last_value, last_id = values
+        if type(last_id) is not int or type(last_value) is not CURSOR_VALUE_TYPES[sort]:
+            raise ValueError("cursor values have the wrong type")
+        if sort == "updated_at":
+            last_value = datetime.datetime.fromisoformat(last_value)
+        return last_value, last_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def json_response(request: Request, payload, headers: Optional[dict] = None) -> Response:
+    """Serialize once, tag with a content ETag and answer 304 when the client already has it."""
+    body = json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/profiles")
-def list_profiles(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    if current_user.role == "admin":
-        profiles = db.query(ClientProfile).all()
+def list_profiles(
+    request: Request,
+    owner: Optional[str] = Query(None),
+    name_prefix: Optional[str] = Query(None),
+    updated_since: Optional[datetime.datetime] = Query(None),
+    updated_before: Optional[datetime.datetime] = Query(None),
+    sort: str = Query("updated_at"),
+    order: str = Query("desc"),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if sort not in PROFILE_LIST_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(PROFILE_LIST_SORTS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+
+    # One query per page: owners are joined in and the JSON document column is never loaded
+    query = db.query(ClientProfile).options(
+        load_only(ClientProfile.id, ClientProfile.name, ClientProfile.created_at, ClientProfile.updated_at, ClientProfile.owner_id),
+        joinedload(ClientProfile.owner).load_only(User.username)
+    )
+    if current_user.role != "admin":
+        query = query.filter(ClientProfile.owner_id == current_user.id)
+    if owner:
+        query = query.filter(ClientProfile.owner.has(User.username == owner))
+    if name_prefix:
+        escaped = name_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(ClientProfile.name.like(f"{escaped}%", escape="\\"))
+    if updated_since:
+        query = query.filter(ClientProfile.updated_at >= updated_since)
+    if updated_before:
+        query = query.filter(ClientProfile.updated_at < updated_before)
+
+    # Keyset pagination on (sort column, id) so deep pages cost the same as the first one
+    sort_col = PROFILE_LIST_SORTS[sort]
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, sort)
+        if order == "desc":
+            query = query.filter(or_(sort_col < last_value, and_(sort_col == last_value, ClientProfile.id < last_id)))
+        else:
+            query = query.filter(or_(sort_col > last_value, and_(sort_col == last_value, ClientProfile.id > last_id)))
+    if order == "desc":
+        query = query.order_by(sort_col.desc(), ClientProfile.id.desc())
     else:
-        profiles = db.query(ClientProfile).filter(ClientProfile.owner_id == current_user.id).all()
-    
-    return [{"id": p.id, "name": p.name, "created_at": p.created_at, "owner": p.owner.username if p.owner else "System"} for p in profiles]
+        query = query.order_by(sort_col.asc(), ClientProfile.id.asc())
+
+    profiles = query.limit(limit + 1).all()
+    headers = {}
+    if len(profiles) > limit:
+        profiles = profiles[:limit]
+        last = profiles[-1]
+        last_value = {"updated_at": last.updated_at, "name": last.name or "", "id": last.id}[sort]
+        headers["X-Next-Cursor"] = encode_cursor([last_value, last.id])
+
+    payload = [
+        {"id": p.id, "name": p.name, "created_at": p.created_at, "updated_at": p.updated_at, "owner": p.owner.username if p.owner else "System"}
+        for p in profiles
+    ]
+    return json_response(request, payload, headers)
+
+RANKING_ORDERS = {
+    "potential_rank": ClientProfile.potential_rank,
+    "net_worth": ClientProfile.net_worth,
+    "updated_at": ClientProfile.updated_at,
+}
+
+@app.get("/profiles/ranking")
+def rank_profiles(
+    risk_tolerance: Optional[str] = Query(None),
+    min_rank: Optional[int] = Query(None),
+    max_rank: Optional[int] = Query(None),
+    min_net_worth: Optional[float] = Query(None),
+    life_insurance_status: Optional[str] = Query(None),
+    health_insurance_status: Optional[str] = Query(None),
+    asset_type: Optional[str] = Query(None),
+    order_by: str = Query("potential_rank"),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Runs entirely on the indexed columns; the JSON document is never loaded
+    if order_by not in RANKING_ORDERS:
+        raise HTTPException(status_code=400, detail=f"order_by must be one of {', '.join(RANKING_ORDERS)}")
+    query = db.query(ClientProfile).options(
+        load_only(
+            ClientProfile.id, ClientProfile.name, ClientProfile.owner_id, ClientProfile.net_worth,
+            ClientProfile.net_worth_text, ClientProfile.risk_tolerance, ClientProfile.potential_rank,
+            ClientProfile.life_insurance_status, ClientProfile.health_insurance_status, ClientProfile.updated_at
+        ),
+        joinedload(ClientProfile.owner).load_only(User.username)
+    )
+    if current_user.role != "admin":
+        query = query.filter(ClientProfile.owner_id == current_user.id)
+    if risk_tolerance:
+        query = query.filter(ClientProfile.risk_tolerance == risk_tolerance)
+    if min_rank is not None:
+        query = query.filter(ClientProfile.potential_rank >= min_rank)
+    if max_rank is not None:
+        query = query.filter(ClientProfile.potential_rank <= max_rank)
+    if min_net_worth is not None:
+        query = query.filter(ClientProfile.net_worth >= min_net_worth)
+    if life_insurance_status:
+        query = query.filter(ClientProfile.life_insurance_status == life_insurance_status)
+    if health_insurance_status:
+        query = query.filter(ClientProfile.health_insurance_status == health_insurance_status)
+    if asset_type:
+        query = query.filter(ClientProfile.assets.any(ProfileAsset.type == asset_type))
+
+    profiles = query.order_by(RANKING_ORDERS[order_by].desc().nulls_last(), ClientProfile.id).limit(limit).all()
+    return [
+        {
+            "id": p.id,
+            "name": p.name,
+            "owner": p.owner.username if p.owner else "System",
+            "net_worth": p.net_worth,
+            "net_worth_text": p.net_worth_text,
+            "risk_tolerance": p.risk_tolerance,
+            "potential_rank": p.potential_rank,
+            "life_insurance_status": p.life_insurance_status,
+            "health_insurance_status": p.health_insurance_status,
+            "updated_at": p.updated_at,
+        }
+        for p in profiles
+    ]
 
 # --- Chat Schemas ---
 class ChatRequest(BaseModel):
     profile_id: Optional[int] = None
+    session_id: Optional[int] = None # continue a server-side session; omit to start one (profile chats only)
     message: str
     context: Optional[dict] = None
     model: Optional[str] = "Gemini 3.1 Pro (Latest)"
 
-@app.post("/chat")
-async def chat_with_profile(
-    chat_request: ChatRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
+class ChatPrompt(NamedTuple):
+    model: str
+    context: ChatContext
+    message: str # the user turn as sent: session summary and recent turns, then the question
+    session_id: Optional[int] # None until the first reply of a profile chat is recorded
+    profile_id: Optional[int] # profile chats are kept as sessions; ad-hoc context chats are not
+
+CHAT_INSTRUCTIONS = """
+You are 'Antigravity AI', an elite Wealth Management intelligence agent.
+You have full access to current financial market trends via search and the client's internal vault.
+
+TASK:
+1. Analyze the client's data (CLIENT VAULT DATA below) deeply. Think strategically.
+2. Use your search capabilities to get the latest market rates, inflation data, or stock performance if needed.
+3. Cross-reference the client's current assets (from the vault) with real-world trends.
+4. Be quantitative. If you don't have enough data for a precise calculation, explain what's missing.
+5. Your tone is institutional, direct, and elite. No generic AI fluff.
+
+You are empowered to suggest risky strategic pivots if the client's data justifies it.
+"""
+
+async def get_profile_async(db: AsyncSession, profile_id: int) -> Optional[ClientProfile]:
+    return (await db.execute(select(ClientProfile).where(ClientProfile.id == profile_id))).scalars().first()
+
+async def build_chat_prompt(chat_request: ChatRequest, current_user: Principal, db: AsyncSession) -> ChatPrompt:
     client_data = ""
-    if chat_request.profile_id:
-        profile = db.query(ClientProfile).filter(ClientProfile.id == chat_request.profile_id).first()
+    message = chat_request.message
+    session_id = None
+    profile_id = chat_request.profile_id
+    if chat_request.session_id is not None:
+        try:
+            session = await chat_sessions.open(db, chat_request.session_id, profile_id, current_user.id)
+        except ChatSessionNotFound:
+            raise HTTPException(status_code=404, detail="Chat session not found")
+        profile_id = session.profile_id
+    if profile_id:
+        with span("profile_lookup"):
+            profile = await get_profile_async(db, profile_id)
         if not profile:
             raise HTTPException(status_code=404, detail="Profile not found")
         
         if current_user.role != "admin" and profile.owner_id != current_user.id:
             raise HTTPException(status_code=403, detail="Not authorized to access this profile")
         client_data = profile.data
+        if chat_request.session_id is not None:
+            with span("chat_history"):
+                message = (await chat_sessions.history(db, session)).prompt(chat_request.message)
+            session_id = session.id
+        # Hand the connection back to the pool before the long provider call
+        await db.close()
     elif chat_request.context:
         client_data = json.dumps(chat_request.context)
     else:
         raise HTTPException(status_code=400, detail="Either profile_id or context must be provided")
 
+    selected_model = resolve_model(chat_request.model)
+    # Static instructions first, then the vault: the whole prefix is stable across turns
+    # and across profile versions until save_profile changes the data.
+    context = ChatContext(
+        instructions=CHAT_INSTRUCTIONS,
+        vault=f"CLIENT VAULT DATA:\n{client_data}",
+        profile_id=profile_id
+    )
+    return ChatPrompt(selected_model, context, message, session_id, profile_id)
+
+@app.post("/chat")
+async def chat_with_profile(
+    chat_request: ChatRequest,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    prompt = await build_chat_prompt(chat_request, current_user, db)
+    if provider_for(prompt.model) is None:
+        return {"response": "Model selection error. Unknown provider."}
+
     try:
-        model_map = {
-            "Gemini 3.1 Pro (Latest)": "gemini-3.1-pro-preview",
-            "Gemini 3 Flash": "gemini-3-flash-preview",
-            "Gemini 2.5 Pro": "gemini-2.5-pro",
-            "Gemini 2.5 Flash": "gemini-2.5-flash",
-            "o3-mini (OpenAI Reasoning)": "o3-mini",
-            "o1 (High Logic)": "o1-preview",
-            "GPT-4o (Standard)": "gpt-4o",
-            "Claude 3.5 Sonnet": "claude-3-5-sonnet-20241022",
-            "Qwen Max": "qwen-max"
-        }
-        
-        selected_model = model_map.get(chat_request.model, "gemini-3.1-pro")
-        
-        system_prompt = f"""
-        You are 'Antigravity AI', an elite Wealth Management intelligence agent.
-        You have full access to current financial market trends via search and the client's internal vault.
-        
-        CLIENT VAULT DATA:
-        {client_data}
-        
-        TASK:
-        1. Analyze the client's data deeply. Think strategically.
-        2. Use your search capabilities to get the latest market rates, inflation data, or stock performance if needed.
-        3. Cross-reference the client's current assets (from the vault) with real-world trends.
-        4. Be quantitative. If you don't have enough data for a precise calculation, explain what's missing.
-        5. Your tone is institutional, direct, and elite. No generic AI fluff.
-        
-        You are empowered to suggest risky strategic pivots if the client's data justifies it.
-        """
-
-        # Dispatch based on provider
-        if "gemini" in selected_model:
-            # Enable Google Search Grounding for Gemini Pro/Flash
-            # Newer models (2025/2026) require 'google_search' tool instead of 'google_search_retrieval'
-            # If the current SDK doesn't support the rename, we catch the 400 and fall back.
-            try:
-                tools = [{"google_search_retrieval": {}}] 
-                model = genai.GenerativeModel(model_name=selected_model, tools=tools)
-                response = model.generate_content([system_prompt, chat_request.message])
-            except Exception as e:
-                if "google_search_retrieval is not supported" in str(e) or "400" in str(e):
-                    # Fallback to call without tools if grounding is cause of failure
-                    model = genai.GenerativeModel(model_name=selected_model)
-                    response = model.generate_content([system_prompt, chat_request.message])
-                else:
-                    raise e
-            return {"response": response.text}
-            
-        elif any(x in selected_model for x in ["gpt", "o1", "o3"]):
-            client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            if not os.getenv("OPENAI_API_KEY"):
-                return {"response": "⚠️ OpenAI API key missing. Please add OPENAI_API_KEY to your .env file."}
-            
-            # o1 and o1-mini use 'developer' role instead of 'system' for core instructions
-            role = "developer" if selected_model.startswith("o") else "system"
-            
-            response = client.chat.completions.create(
-                model=selected_model,
-                messages=[
-                    {"role": role, "content": system_prompt},
-                    {"role": "user", "content": chat_request.message}
-                ]
-            )
-            return {"response": response.choices[0].message.content}
-            
-        elif "claude" in selected_model:
-            client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-            if not os.getenv("ANTHROPIC_API_KEY"):
-                return {"response": "⚠️ Anthropic API key missing. Please add ANTHROPIC_API_KEY to your .env file."}
-                
-            response = client.messages.create(
-                model=selected_model,
-                max_tokens=2048,
-                system=system_prompt,
-                messages=[{"role": "user", "content": chat_request.message}]
+        # The router picks a healthy model, hedges slow calls and falls back on errors
+        response_text, served_model = await model_router.complete(prompt.model, prompt.context, prompt.message)
+        session_id = prompt.session_id
+        if prompt.profile_id:
+            session_id = await chat_sessions.record(
+                session_id, prompt.profile_id, current_user.id, chat_request.message, response_text, served_model
             )
-            return {"response": response.content[0].text}
-            
-        elif "qwen" in selected_model:
-            api_key = os.getenv("QWEN_API_KEY")
-            if not api_key:
-                return {"response": "⚠️ Qwen API key missing. Please add QWEN_API_KEY to your .env file."}
-            
-            client = openai.OpenAI(
-                api_key=api_key,
-                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-            )
-            
-            response = client.chat.completions.create(
-                model=selected_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": chat_request.message}
-                ]
-            )
-            return {"response": response.choices[0].message.content}
-            
-        else:
-            return {"response": "Model selection error. Unknown provider."}
-
+        return {"response": response_text, "model": served_model, "session_id": session_id}
+    except ProviderKeyMissing as e:
+        return {"response": str(e)}
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/analyze")
-async def analyze_financial_data(
-    files: Optional[List[UploadFile]] = File(None), 
-    transcript: Optional[str] = Form(None),
+def sse_event(payload: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_with_profile_stream(
+    chat_request: ChatRequest,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    prompt = await build_chat_prompt(chat_request, current_user, db)
+
+    async def event_stream():
+        served_model = prompt.model
+        if provider_for(prompt.model) is None:
+            yield sse_event({"delta": "Model selection error. Unknown provider."})
+            yield sse_event({}, event="done")
+            return
+        reply = []
+        try:
+            # Forward each provider delta as soon as it arrives; nothing is buffered here
+            async for delta in model_router.stream(prompt.model, prompt.context, prompt.message):
+                if isinstance(delta, tuple):
+                    served_model = delta[1]
+                    continue
+                reply.append(delta)
+                yield sse_event({"delta": delta})
+        except ProviderKeyMissing as e:
+            yield sse_event({"delta": str(e)})
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield sse_event({"detail": str(e)}, event="error")
+            return
+        session_id = prompt.session_id
+        if prompt.profile_id and reply:
+            session_id = await chat_sessions.record(
+                session_id, prompt.profile_id, current_user.id, chat_request.message, "".join(reply), served_model
+            )
+        yield sse_event({"model": served_model, "session_id": session_id}, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# --- Chat Sessions ---
+async def get_own_session(db: AsyncSession, session_id: int, current_user: Principal) -> ChatSession:
+    session = await db.get(ChatSession, session_id)
+    if session is None or session.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return session
+
+@app.get("/chat/sessions")
+async def list_chat_sessions(
     profile_id: Optional[int] = Query(None),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    query = (
+        select(ChatSession.id, ChatSession.profile_id, ChatSession.created_at, ChatSession.updated_at, func.count(ChatMessage.id))
+        .outerjoin(ChatMessage, ChatMessage.session_id == ChatSession.id)
+        .where(ChatSession.user_id == current_user.id)
+        .group_by(ChatSession.id)
+        .order_by(ChatSession.updated_at.desc())
+    )
+    if profile_id is not None:
+        query = query.where(ChatSession.profile_id == profile_id)
+    return [
+        {"id": id, "profile_id": pid, "created_at": created_at, "updated_at": updated_at, "messages": count}
+        for id, pid, created_at, updated_at, count in (await db.execute(query)).all()
+    ]
+
+@app.get("/chat/sessions/{session_id}")
+async def get_chat_session(
+    session_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    session = await get_own_session(db, session_id, current_user)
+    messages = (await db.execute(
+        select(ChatMessage.role, ChatMessage.content, ChatMessage.model, ChatMessage.created_at)
+        .where(ChatMessage.session_id == session_id)
+        .order_by(ChatMessage.id)
+    )).all()
+    return {
+        "id": session.id,
+        "profile_id": session.profile_id,
+        "summary": session.summary,
+        "messages": [
+            {"role": role, "content": content, "model": model, "created_at": created_at}
+            for role, content, model, created_at in messages
+        ],
+    }
+
+@app.delete("/chat/sessions/{session_id}")
+async def delete_chat_session(
+    session_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    session = await get_own_session(db, session_id, current_user)
+    await db.delete(session)
+    await db.commit()
+    return {"message": "Chat session deleted"}
+
+class AnalysisInput(NamedTuple):
+    filename: str
+    content_type: str
+    stream: BinaryIO
+
+ANALYSIS_STAGES = ["extracting", "uploading", "generating", "parsing"]
+
+def is_image(item: AnalysisInput) -> bool:
+    filename = item.filename.lower()
+    return any(filename.endswith(ext) for ext in [".png", ".jpg", ".jpeg"]) or item.content_type.startswith("image/")
+
+def is_pdf(item: AnalysisInput) -> bool:
+    filename = item.filename.lower()
+    return not is_image(item) and (filename.endswith(".pdf") or item.content_type == "application/pdf")
+
+def stream_size(stream) -> int:
+    position = stream.tell()
+    size = stream.seek(0, io.SEEK_END)
+    stream.seek(position)
+    return size
+
+async def load_analysis_context(profile_id: Optional[int], current_user: Principal, db: AsyncSession) -> Optional[str]:
+    if not profile_id:
+        return None
+    profile = await get_profile_async(db, profile_id)
+    await db.close()
+    if not profile:
+        return None
+    # Check permission
+    if current_user.role != "admin" and profile.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this profile")
+    return profile.data
+
+# Incremental mode replaces the full-analysis prompt: the model is asked for a patch, never a profile.
+# The patch is wrapped in {"patch": ...} so a reply that ignored the instruction can be told apart.
+INCREMENTAL_PROMPT = """You are an elite Wealth Manager updating an existing client profile.
+EXISTING CLIENT DATA below is the current profile. Read the NEW DATA (documents, whiteboard photos, audio,
+meeting transcripts) that follows it and work out only what it changes.
+
+Return strict JSON of the form {{"patch": PATCH}}, where PATCH is a JSON merge patch (RFC 7386) against
+EXISTING CLIENT DATA, using the same keys and structure as that data:
+- Include only sections or fields that are new or whose value changes because of the NEW DATA; omit everything unchanged.
+- Objects are merged key by key. Lists replace the existing list, so give the complete updated list when a list changes.
+- Use null only to remove a field that the new data shows is no longer true.
+- Recalculate client_profile.potential_rank (1-10) only if the new data changes it.
+- If nothing changes, return {{"patch": {{}}}}.
+Do NOT return the full profile.
+
+EXISTING CLIENT DATA:
+{existing_data}
+"""
+
+# Preprocessing settings that change what the model is sent for the same uploads; part of the result cache key
+ANALYZE_INPUT_SETTINGS = {
+    "pdf_min_page_chars": PDF_MIN_PAGE_CHARS,
+    "image_quality_profile": IMAGE_QUALITY_PROFILE,
+    "image_max_pixels": IMAGE_MAX_PIXELS,
+    "image_jpeg_quality": IMAGE_JPEG_QUALITY,
+    "image_duplicate_distance": IMAGE_DUPLICATE_DISTANCE,
+}
+
+async def run_analysis(
+    inputs: List[AnalysisInput],
+    transcript: Optional[str],
+    existing_data: Optional[str],
+    refresh: bool = False,
+    incremental: bool = False,
+    on_stage: Optional[Callable[[str], None]] = None
+) -> dict:
+    """extract -> upload -> generate -> parse. Shared by /analyze and the job queue."""
+    timer = StageTimer("analyze")
+    def stage(name):
+        timer.enter(name)
+        if on_stage:
+            on_stage(name)
+
+    try:
+        return await _run_analysis(inputs, transcript, existing_data, refresh, incremental and existing_data is not None, stage, timer)
+    finally:
+        timer.close()
+
+async def _run_analysis(inputs, transcript, existing_data, refresh, incremental, stage, timer) -> dict:
+    stage("extracting")
     existing_context = ""
-    
-    if profile_id:
-        profile = db.query(ClientProfile).filter(ClientProfile.id == profile_id).first()
-        if profile:
-            # Check permission
-            if current_user.role != "admin" and profile.owner_id != current_user.id:
-                raise HTTPException(status_code=403, detail="Not authorized to access this profile")
-            existing_context = f"\nEXISTING CLIENT DATA (CONTEXT):\n{profile.data}\n"
+    context_version = None
+    if existing_data is not None:
+        existing_context = f"\nEXISTING CLIENT DATA (CONTEXT):\n{existing_data}\n"
+        context_version = hashlib.sha256(existing_data.encode("utf-8")).hexdigest()
+        if incremental:
+            context_version += ":incremental"
 
+    # Identical inputs (same bytes, transcript, profile state and prompt) reuse the stored result
+    timer.enter("hashing")
+    digests = [await asyncio.to_thread(hash_stream, item.stream) for item in inputs]
+    file_hashes = [(item.filename, item.content_type, digest) for item, digest in zip(inputs, digests)]
+    cache_key = analysis_key(ANALYZE_MODEL, file_hashes, transcript, context_version, ANALYZE_INPUT_SETTINGS)
+    timer.enter("cache_lookup")
+    if not refresh:
+        cached = await analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    timer.enter("extracting")
+    pending_uploads = []
     try:
         prompt_parts = [
-            f"""You are an elite Wealth Manager. Analyze the attached client documents, whiteboard photos, audio, and meeting transcripts. 
-            {"Incorporate these new details into the existing client profile provided below." if profile_id else "Create a new comprehensive financial analysis."}
+            INCREMENTAL_PROMPT.format(existing_data=existing_data) if incremental else f"""You are an elite Wealth Manager. Analyze the attached client documents, whiteboard photos, audio, and meeting transcripts. 
+            {"Incorporate these new details into the existing client profile provided below." if existing_data is not None else "Create a new comprehensive financial analysis."}
             Extract personal details such as full name, date of birth/age, occupation, contact information, family tree, digital footprint, and residential address from the provided documents and transcripts.
             
             Output a comprehensive financial analysis in strict JSON format.
@@ -394,59 +735,115 @@ async def analyze_financial_data(
         if transcript:
             prompt_parts.append(f"MEETING TRANSCRIPT/MINUTES:\n{transcript}\n")
         
-        if files:
-            for file in files:
-                content_type = file.content_type
-                filename = file.filename.lower()
-                file_bytes = await file.read()
+        if inputs:
+            # PDFs and images are prepared on the process pool concurrently, ahead of the ordered pass below
+            pdf_indexes = [i for i, item in enumerate(inputs) if is_pdf(item)]
+            image_indexes = [i for i, item in enumerate(inputs) if is_image(item)]
+            prepared = await asyncio.gather(
+                *(pdf_preprocessor.split(inputs[i].stream, digests[i]) for i in pdf_indexes),
+                *(image_preprocessor.prepare(inputs[i].stream, digests[i]) for i in image_indexes)
+            )
+            pdf_splits = dict(zip(pdf_indexes, prepared[:len(pdf_indexes)]))
+            images = dict(zip(image_indexes, prepared[len(pdf_indexes):]))
+            # Repeat shots of the same whiteboard are sent once
+            duplicate_images = {
+                image_indexes[i]: image_indexes[j]
+                for i, j in find_duplicates([images[i] for i in image_indexes]).items()
+            }
+            # File API uploads run concurrently; their slots are filled in afterwards so
+            # the model still sees parts in upload order.
+            for index, (item, digest) in enumerate(zip(inputs, digests)):
+                content_type = item.content_type
+                filename = item.filename.lower()
                 
-                # Handle Images (Directly via PIL)
-                if any(filename.endswith(ext) for ext in [".png", ".jpg", ".jpeg"]) or content_type.startswith("image/"):
-                    img = Image.open(io.BytesIO(file_bytes))
-                    prompt_parts.append(img)
+                # Images: oriented, downscaled and re-encoded JPEG bytes
+                if index in images:
+                    image = images[index]
+                    if index in duplicate_images:
+                        original = inputs[duplicate_images[index]].filename.lower()
+                        prompt_parts.append(f"\nImage: {filename} (near-duplicate of {original}, not repeated)\n")
+                        image_duplicates.inc()
+                        continue
+                    if image is None:
+                        # Undecodable here (e.g. HEIC); let the model try the original bytes
+                        data = await asyncio.to_thread(item.stream.read)
+                        prompt_parts.append({"mime_type": guess_mime_type(filename, content_type), "data": data})
+                    else:
+                        prompt_parts.append(image.blob())
+                        image_bytes.inc("original", amount=image.original_bytes)
+                        image_bytes.inc("sent", amount=len(image.data))
                     prompt_parts.append(f"\nImage: {filename}\n")
                 
-                # Handle PDFs and Audio (Using File API for multimodal processing)
-                elif filename.endswith(".pdf") or content_type == "application/pdf" or \
-                    any(filename.endswith(ext) for ext in [".mp3", ".wav", ".m4a", ".aac", ".mp4", ".mov"]) or content_type.startswith("audio/") or content_type.startswith("video/"):
-                    
-                    suffix = os.path.splitext(filename)[1]
-                    # Fallback suffix if splitext fails
-                    if not suffix:
-                        if "pdf" in content_type:
-                            suffix = ".pdf"
-                        elif "audio" in content_type:
-                            suffix = ".mp3"
-                        elif "video" in content_type:
-                            suffix = ".mp4"
-                        else:
-                            suffix = ".tmp" # Generic fallback
-                    
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                        tmp.write(file_bytes)
-                        tmp_path = tmp.name
+                # PDFs: pages with a text layer go in as text; only scanned pages are uploaded
+                elif index in pdf_splits:
+                    pages = pdf_splits[index]
+                    if pages is not None and not pages.scanned:
+                        prompt_parts.append(f"Content from {filename} (text layer, {pages.page_count} pages):\n{pages.text()}\n")
+                        pdf_pages.inc("text", amount=pages.page_count)
+                        pdf_upload_bytes_saved.inc(amount=stream_size(item.stream))
+                    elif pages is not None and pages.scanned_pdf is not None:
+                        prompt_parts.append(f"Content from {filename} (text layer, {pages.page_count - len(pages.scanned)} of {pages.page_count} pages):\n{pages.text()}\n")
+                        scanned_list = ", ".join(str(i + 1) for i in pages.scanned)
+                        prompt_parts.append(f"\nScanned pages {scanned_list} of {filename}:\n")
+                        prompt_parts.append(None)
+                        scanned_digest = f"{digest}:scanned"
+                        pending_uploads.append((
+                            len(prompt_parts) - 1,
+                            scanned_digest,
+                            remote_files.upload(io.BytesIO(pages.scanned_pdf), scanned_digest, "application/pdf", filename)
+                        ))
+                        pdf_pages.inc("text", amount=pages.page_count - len(pages.scanned))
+                        pdf_pages.inc("scanned", amount=len(pages.scanned))
+                        pdf_upload_bytes_saved.inc(amount=max(0, stream_size(item.stream) - len(pages.scanned_pdf)))
+                    else:
+                        # Fully scanned or unparseable: the model reads the original file
+                        if pages is not None:
+                            pdf_pages.inc("scanned", amount=pages.page_count)
+                        prompt_parts.append(None)
+                        pending_uploads.append((
+                            len(prompt_parts) - 1,
+                            digest,
+                            remote_files.upload(item.stream, digest, "application/pdf", filename)
+                        ))
+
+                # Audio and video (Using File API for multimodal processing)
+                elif any(filename.endswith(ext) for ext in [".mp3", ".wav", ".m4a", ".aac", ".mp4", ".mov"]) or content_type.startswith("audio/") or content_type.startswith("video/"):
                     
-                    try:
-                        uploaded_file = genai.upload_file(path=tmp_path, display_name=filename)
-                        prompt_parts.append(uploaded_file)
-                    finally:
-                        if os.path.exists(tmp_path): 
-                            os.remove(tmp_path)
+                    mime_type = guess_mime_type(filename, content_type)
+                    prompt_parts.append(None)
+                    pending_uploads.append((
+                        len(prompt_parts) - 1,
+                        digest,
+                        remote_files.upload(item.stream, digest, mime_type, filename)
+                    ))
                 
                 # Generic text fallback (like TXT files if any)
                 else:
                     try:
-                        text_content = file_bytes.decode("utf-8")
+                        text_content = (await asyncio.to_thread(item.stream.read)).decode("utf-8")
                         prompt_parts.append(f"Content from {filename}:\n{text_content}\n")
                     except:
                         pass
 
-        model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash",
-            generation_config={"response_mime_type": "application/json"}
-        )
+            stage("uploading")
+            if pending_uploads:
+                uploaded = await asyncio.gather(*(upload for _, _, upload in pending_uploads))
+                for (slot, _, _), uploaded_file in zip(pending_uploads, uploaded):
+                    prompt_parts[slot] = uploaded_file
 
-        response = model.generate_content(prompt_parts)
+        stage("generating")
+        try:
+            response = await providers.gemini_generate(
+                prompt_parts,
+                model_name=ANALYZE_MODEL,
+                generation_config={"response_mime_type": "application/json"}
+            )
+        except Exception:
+            # A reused handle may have been deleted remotely; make a retry upload afresh
+            for _, digest, _ in pending_uploads:
+                remote_files.forget(digest)
+            raise
+        stage("parsing")
         res_text = response.text
         if "```json" in res_text:
             res_text = res_text.split("```json")[1].split("```")[0].strip()
@@ -454,92 +851,439 @@ async def analyze_financial_data(
             res_text = res_text.split("```")[1].strip()
             
         analysis_data = json.loads(res_text)
+        if incremental:
+            # The model returned only what changed; merge it locally into the stored profile
+            patch = analysis_data.get("patch") if isinstance(analysis_data, dict) else None
+            if not isinstance(patch, dict):
+                raise HTTPException(status_code=502, detail="Model did not return a profile patch")
+            analysis_data = merge_patch(json.loads(existing_data), patch)
+        elif not isinstance(analysis_data, dict):
+            raise HTTPException(status_code=502, detail="Model did not return a JSON object")
+        timer.enter("cache_store")
+        await analysis_cache.put(cache_key, analysis_data)
         return analysis_data
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"CHAT ERROR: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/save_profile")
-def save_profile(
-    name: str = Body(..., embed=True), 
-    data: dict = Body(..., embed=True),
-    current_user: User = Depends(get_current_user),
+@app.post("/analyze")
+async def analyze_financial_data(
+    files: Optional[List[UploadFile]] = File(None), 
+    transcript: Optional[str] = Form(None),
+    profile_id: Optional[int] = Query(None),
+    refresh: bool = Query(False),
+    incremental: bool = Query(False, description="With profile_id: ask the model for changes only and merge them locally (the UI uses this when updating a saved profile)"),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    existing_data = await load_analysis_context(profile_id, current_user, db)
+    inputs = [AnalysisInput(f.filename, f.content_type, f.file) for f in files or []]
+    return await run_analysis(inputs, transcript, existing_data, refresh=refresh, incremental=incremental)
+
+# --- Analysis Jobs ---
+# Long multimodal analyses run on a bounded worker pool in the process that accepted them; status and
+# results go to the database, so the client's polls may land on any worker.
+@app.post("/analyze/jobs", status_code=202)
+async def submit_analysis_job(
+    files: Optional[List[UploadFile]] = File(None),
+    transcript: Optional[str] = Form(None),
+    profile_id: Optional[int] = Query(None),
+    refresh: bool = Query(False),
+    incremental: bool = Query(False),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    existing_data = await load_analysis_context(profile_id, current_user, db)
+    # UploadFiles are closed when this request ends, so the job gets its own spooled copies
+    inputs = [
+        AnalysisInput(f.filename, f.content_type, await asyncio.to_thread(spool_copy, f.file))
+        for f in files or []
+    ]
+
+    async def work(job: Job):
+        try:
+            return await run_analysis(
+                inputs, transcript, existing_data, refresh=refresh, incremental=incremental, on_stage=job.enter_stage
+            )
+        except HTTPException as e:
+            raise RuntimeError(e.detail)
+        finally:
+            for item in inputs:
+                item.stream.close()
+
+    try:
+        job = await analysis_jobs.submit(work, owner_id=current_user.id, kind="analyze", stages=ANALYSIS_STAGES)
+    except JobQueueFull:
+        for item in inputs:
+            item.stream.close()
+        raise HTTPException(status_code=503, detail="Analysis queue is full. Please retry shortly.")
+    return job.status()
+
+# --- Batch Onboarding ---
+# One zip with a folder per client (folder name = profile name). Each folder goes through
+# the same analysis pipeline and save path as a single client; the job result is a per-client report.
+BATCH_STAGES = ["unpacking", "analyzing"]
+
+def load_profile_data_by_name(owner_id: int, name: str) -> Optional[str]:
+    with SessionLocal() as db:
+        return db.query(ClientProfile.data).filter(
+            ClientProfile.name == name, ClientProfile.owner_id == owner_id
+        ).scalar()
+
+def save_batch_profile(owner_id: int, name: str, data: dict) -> int:
+    with SessionLocal() as db:
+        return store_profile(db, owner_id, name, data).id
+
+async def ingest_bundle(archive: zipfile.ZipFile, bundle, owner_id: int, refresh: bool, incremental: bool) -> dict:
+    started = time.monotonic()
+    report = {"client": bundle.name, "files": len(bundle.members), "status": "failed", "profile_id": None, "error": None}
+    inputs = []
+    try:
+        for info in bundle.members:
+            inputs.append(AnalysisInput(*await asyncio.to_thread(extract_member, archive, info)))
+        # Re-running a batch folds new documents into the profile saved last time
+        existing_data = await asyncio.to_thread(load_profile_data_by_name, owner_id, bundle.name)
+        data = await run_analysis(inputs, None, existing_data, refresh=refresh, incremental=incremental)
+        profile_id = await asyncio.to_thread(save_batch_profile, owner_id, bundle.name, data)
+        await asyncio.to_thread(prompt_cache.invalidate_profile, profile_id)
+        report.update(status="saved", profile_id=profile_id)
+    except HTTPException as e:
+        report["error"] = e.detail
+    except Exception as e:
+        print(f"Batch: {bundle.name} failed: {e}")
+        report["error"] = str(e)
+    finally:
+        for item in inputs:
+            item.stream.close()
+    report["seconds"] = round(time.monotonic() - started, 2)
+    return report
+
+@app.post("/analyze/batch", status_code=202)
+async def submit_analysis_batch(
+    archive: UploadFile = File(...),
+    refresh: bool = Query(False),
+    incremental: bool = Query(False),
+    current_user: Principal = Depends(get_current_user)
+):
+    spooled = await asyncio.to_thread(spool_copy, archive.file)
+    try:
+        bundle_zip = zipfile.ZipFile(spooled)
+        bundles = list_bundles(bundle_zip)
+    except (zipfile.BadZipFile, BatchArchiveError) as e:
+        spooled.close()
+        raise HTTPException(status_code=400, detail=f"Invalid batch archive: {e}")
+    owner_id = current_user.id
+
+    async def work(job: Job):
+        job.enter_stage("unpacking", f"{len(bundles)} clients")
+        limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+        finished = 0
+
+        async def run(bundle):
+            nonlocal finished
+            async with limit:
+                report = await ingest_bundle(bundle_zip, bundle, owner_id, refresh, incremental)
+            finished += 1
+            job.enter_stage("analyzing", f"{finished}/{len(bundles)} clients done")
+            return report
+
+        try:
+            clients = await asyncio.gather(*(run(bundle) for bundle in bundles))
+        finally:
+            bundle_zip.close()
+            spooled.close()
+        saved = sum(1 for report in clients if report["status"] == "saved")
+        return {"total": len(clients), "saved": saved, "failed": len(clients) - saved, "clients": clients}
+
+    try:
+        job = await analysis_jobs.submit(work, owner_id=owner_id, kind="analyze_batch", stages=BATCH_STAGES)
+    except JobQueueFull:
+        bundle_zip.close()
+        spooled.close()
+        raise HTTPException(status_code=503, detail="Analysis queue is full. Please retry shortly.")
+    return job.status()
+
+async def get_owned_job(job_id: str, current_user: Principal) -> JobRecord:
+    job = await analysis_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if current_user.role != "admin" and job.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this job")
+    return job
+
+@app.get("/analyze/jobs/{job_id}")
+async def get_analysis_job(job_id: str, current_user: Principal = Depends(get_current_user)):
+    return (await get_owned_job(job_id, current_user)).status
+
+@app.get("/analyze/jobs/{job_id}/result")
+async def get_analysis_job_result(job_id: str, current_user: Principal = Depends(get_current_user)):
+    job = await get_owned_job(job_id, current_user)
+    if job.state == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.state != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job.state}")
+    # Stored as JSON text already
+    return Response(content=job.result, media_type="application/json")
+
+@app.get("/analyze/cache/stats")
+def analysis_cache_stats(current_user: Principal = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return {**analysis_cache.stats(), "remote_files": remote_files.stats()}
+
+@app.get("/router/stats")
+def router_stats(current_user: Principal = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return model_router.stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request, db: AsyncSession = Depends(get_async_db)):
+    # Scrapers send the METRICS_TOKEN; otherwise an admin login is required unless METRICS_PUBLIC=1
+    if not METRICS_PUBLIC:
+        authorization = request.headers.get("Authorization", "")
+        if not (METRICS_TOKEN and authorization == f"Bearer {METRICS_TOKEN}"):
+            scheme, _, token = authorization.partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+            if (await get_current_user(token, db)).role != "admin":
+                raise HTTPException(status_code=403, detail="Admin access required")
+    return Response(registry.render(), media_type="text/plain; version=0.0.4")
+
+# --- Book Analytics ---
+def require_admin(current_user: Principal = Depends(get_current_user)) -> Principal:
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+@app.get("/analytics/aum")
+def analytics_aum(current_user: Principal = Depends(require_admin), db: Session = Depends(get_db)):
+    """Assets under management by category, for the whole book and per RM."""
+    return book_analytics.aum(db)
+
+@app.get("/analytics/concentration")
+def analytics_concentration(
+    top_clients: int = Query(5, ge=1, le=50),
+    current_user: Principal = Depends(require_admin),
     db: Session = Depends(get_db)
 ):
+    """Per RM: share of AUM in the largest category and in the largest clients (with HHI)."""
+    return book_analytics.concentration(db, top_clients)
+
+@app.get("/analytics/sip")
+def analytics_sip(current_user: Principal = Depends(require_admin), db: Session = Depends(get_db)):
+    """Monthly SIP run-rate across the book and per RM."""
+    return book_analytics.sip(db)
+
+@app.get("/analytics/ranks")
+def analytics_ranks(current_user: Principal = Depends(require_admin), db: Session = Depends(get_db)):
+    """Distribution of potential_rank (1-10) across the book and per RM."""
+    return book_analytics.ranks(db)
+
+def store_profile(db: Session, owner_id: int, name: str, data: dict) -> ClientProfile:
+    """Create or update the owner's profile with this name. Shared by /save_profile and batch ingestion."""
     # Check if profile with this name exists for this user
     profile = db.query(ClientProfile).filter(
         ClientProfile.name == name,
-        ClientProfile.owner_id == current_user.id
-    ).first()
-    
+        ClientProfile.owner_id == owner_id
+    ).with_for_update().first()
     if profile:
+        # Concurrent saves of one profile must not both take version N+1. FOR UPDATE covers Postgres;
+        # on SQLite this no-op write takes the database write lock, and the refresh then reads the
+        # version the previous save committed.
+        db.execute(
+            update(ClientProfile).where(ClientProfile.id == profile.id)
+            .values(version=ClientProfile.version, updated_at=ClientProfile.updated_at)
+        )
+        db.refresh(profile)
+        try:
+            old_data = json.loads(profile.data) if profile.data else None
+        except ValueError:
+            old_data = None
+        # Saving identical data is a no-op: no new version, no rewrite
+        if not record_version(db, profile, old_data, data, author_id=owner_id):
+            return profile
         profile.data = json.dumps(data)
     else:
-        profile = ClientProfile(name=name, data=json.dumps(data), owner_id=current_user.id)
+        profile = ClientProfile(name=name, data=json.dumps(data), owner_id=owner_id)
         db.add(profile)
+        record_version(db, profile, None, data, author_id=owner_id)
+    index_profile(profile, data)
+    # New rows need their id before the search index row can point at them
+    db.flush()
+    update_search_index(db, profile, data)
     
     db.commit()
     db.refresh(profile)
+    book_analytics.profile_saved(profile)
+    return profile
+
+@app.post("/save_profile")
+def save_profile(
+    background_tasks: BackgroundTasks,
+    name: str = Body(..., embed=True), 
+    data: dict = Body(..., embed=True),
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    profile = store_profile(db, current_user.id, name, data)
+    # Provider-side caches of the old vault are now stale
+    background_tasks.add_task(prompt_cache.invalidate_profile, profile.id)
     return {"id": profile.id, "message": "Profile saved successfully"}
 
+@app.get("/profiles/search")
+def search_profile_text(
+    q: str = Query(..., min_length=1, description="Words matched as prefixes across names, assets, goals, risks and meeting notes"),
+    min_asset_value: Optional[float] = Query(None, description="Only clients holding an asset worth at least this many rupees (latest saved version)"),
+    asset_period: Optional[str] = Query(None, description="Compare min_asset_value against recurring amounts of this period (e.g. monthly SIPs) instead of holding values"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Ranked by the full-text index; no profile documents are loaded
+    if asset_period not in (None, "month", "year"):
+        raise HTTPException(status_code=400, detail="asset_period must be month or year")
+    owner_id = None if current_user.role == "admin" else current_user.id
+    return search_profiles(db, q, owner_id=owner_id, min_asset_value=min_asset_value, asset_period=asset_period, limit=limit, offset=offset)
+
 @app.get("/profiles/{profile_id}")
 def get_profile(
     profile_id: int,
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    profile = db.query(ClientProfile).filter(ClientProfile.id == profile_id).first()
+    # Only the small columns first: a revalidating client gets its 304 without the document being read
+    profile = (
+        db.query(ClientProfile)
+        .options(load_only(ClientProfile.id, ClientProfile.owner_id, ClientProfile.version, ClientProfile.updated_at))
+        .filter(ClientProfile.id == profile_id)
+        .first()
+    )
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
     
     # Check permission
     if current_user.role != "admin" and profile.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to access this profile")
-        
-    return json.loads(profile.data)
+
+    etag = profile_etag(profile.id, profile.version, profile.updated_at)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization, Accept-Encoding"}
+    if profile.updated_at:
+        headers["Last-Modified"] = http_date(profile.updated_at)
+    if not_modified(request.headers, etag, profile.updated_at):
+        return Response(status_code=304, headers=headers)
+
+    payload = profile_payloads.get(profile.id)
+    if payload is None or payload.etag != etag:
+        # The stored text is already the JSON document: serve it as is, no decode/re-encode
+        data = db.query(ClientProfile.data).filter(ClientProfile.id == profile.id).scalar()
+        payload = ProfilePayload(etag, profile.updated_at, data.encode("utf-8"))
+        profile_payloads.set(profile.id, payload)
+    content, encoding = payload.encode(request.headers.get("accept-encoding", ""))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type="application/json", headers=headers)
+
+# --- Profile History ---
+def get_readable_profile(db: Session, profile_id: int, current_user: Principal) -> ClientProfile:
+    profile = db.query(ClientProfile).options(load_only(ClientProfile.id, ClientProfile.owner_id, ClientProfile.version)).filter(ClientProfile.id == profile_id).first()
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if current_user.role != "admin" and profile.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this profile")
+    return profile
+
+def read_version(db: Session, profile_id: int, version: int) -> dict:
+    try:
+        return load_version(db, profile_id, version)
+    except VersionNotFound:
+        raise HTTPException(status_code=404, detail=f"Version {version} not found")
+
+@app.get("/profiles/{profile_id}/versions")
+def list_profile_versions(
+    profile_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    profile = get_readable_profile(db, profile_id, current_user)
+    rows = (
+        db.query(ProfileVersion.version, ProfileVersion.kind, ProfileVersion.created_at, User.username)
+        .outerjoin(User, User.id == ProfileVersion.author_id)
+        .filter(ProfileVersion.profile_id == profile_id)
+        .order_by(ProfileVersion.version.desc())
+        .all()
+    )
+    return {
+        "current_version": profile.version,
+        "versions": [
+            {"version": v, "kind": kind, "created_at": created_at, "author": author}
+            for v, kind, created_at, author in rows
+        ],
+    }
+
+@app.get("/profiles/{profile_id}/versions/{version}")
+def get_profile_version(
+    profile_id: int,
+    version: int,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    get_readable_profile(db, profile_id, current_user)
+    return read_version(db, profile_id, version)
+
+@app.get("/profiles/{profile_id}/diff")
+def diff_profile_versions(
+    profile_id: int,
+    to_version: Optional[int] = Query(None, alias="to"),
+    from_version: Optional[int] = Query(None, alias="from"),
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """JSON merge patch (RFC 7386) from one version to another; defaults to the latest change."""
+    profile = get_readable_profile(db, profile_id, current_user)
+    to_version = to_version or profile.version
+    if not to_version:
+        raise HTTPException(status_code=404, detail="Profile has no recorded versions")
+    from_version = from_version if from_version is not None else to_version - 1
+    new = read_version(db, profile_id, to_version)
+    old = read_version(db, profile_id, from_version) if from_version > 0 else {}
+    patch = make_patch(old, new)
+    if patch is None:
+        # Explicit nulls can't be expressed as a merge patch; fall back to the full target document
+        return {"from": from_version, "to": to_version, "patch": None, "document": new}
+    return {"from": from_version, "to": to_version, "patch": patch}
 
 # --- Seed Script ---
+SEED_USERS = [
+    ("admin", "admin123", "admin"),
+    ("employee1", "emp123", "employee"),
+    ("employee2", "emp456", "employee"),
+]
+
 def seed_data():
+    """Create the default accounts that don't exist yet; run by upgrade_schema."""
     db = SessionLocal()
-    # Create Admin
-    admin = db.query(User).filter(User.username == "admin").first()
-    if not admin:
-        admin = User(
-            username="admin",
-            hashed_password=get_password_hash("admin123"),
-            role="admin"
-        )
-        db.add(admin)
-    
-    # Create Employee
-    emp = db.query(User).filter(User.username == "employee1").first()
-    if not emp:
-        emp = User(
-            username="employee1",
-            hashed_password=get_password_hash("emp123"),
-            role="employee"
-        )
-        db.add(emp)
-    
-    # Create Employee 2
-    emp2 = db.query(User).filter(User.username == "employee2").first()
-    if not emp2:
-        emp2 = User(
-            username="employee2",
-            hashed_password=get_password_hash("emp456"),
-            role="employee"
-        )
-        db.add(emp2)
-    
-    db.commit()
-    db.close()
+    try:
+        # One lookup for all of them; bcrypt only runs for accounts actually missing
+        existing = {
+            username for (username,) in
+            db.query(User.username).filter(User.username.in_([u for u, _, _ in SEED_USERS]))
+        }
+        for username, password, role in SEED_USERS:
+            if username not in existing:
+                db.add(User(username=username, hashed_password=get_password_hash(password), role=role))
+        db.commit()
+        if len(existing) < len(SEED_USERS):
+            print("Railway: Database seed successful.")
+    finally:
+        db.close()
 
-@app.on_event("startup")
-async def startup_event():
-    print("Railway: Running startup sequence...")
-    seed_data()
-    print("Railway: Database seed successful.")
+startup_phases["import"] = time.perf_counter() - IMPORT_STARTED
 
 if __name__ == "__main__":
     import uvicorn
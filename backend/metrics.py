@@ -0,0 +1,320 @@
+import os
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# Adds a Server-Timing header (stage durations, DB query count) to every response when "1".
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+# /metrics accepts "Authorization: Bearer <METRICS_TOKEN>" when set, or an admin's login token.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# "1" serves /metrics without any authentication (only behind a private network)
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+# --- Metric Types ---
+# A small in-process registry rendered in the Prometheus text format; recording is a
+# dict lookup and an add under a lock, cheap enough for every request.
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _label_text(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = list(self.values.items())
+        return self.header() + [f"{self.name}{self._label_text(k)} {v}" for k, v in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+        self.values = {} # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self.values.items()]
+        lines = self.header()
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._label_text(labels, le)} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{self._label_text(labels, le)} {cumulative}")
+            lines.append(f"{self.name}_count{self._label_text(labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(labels)} {round(series[-1], 6)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = [] # callables returning exposition lines, run at scrape time
+
+    def counter(self, name, help_text, labels=()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        self.collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            try:
+                lines.extend(collect())
+            except Exception as e:
+                print(f"Metrics: collector {collect.__name__} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter("wealthsync_http_requests_total", "HTTP requests", ("method", "route", "status"))
+http_latency = registry.histogram("wealthsync_http_request_seconds", "HTTP request latency until the response starts", ("method", "route"))
+stage_latency = registry.histogram("wealthsync_stage_seconds", "Time spent in a named pipeline stage", ("stage",))
+db_queries = registry.counter("wealthsync_db_queries_total", "SQL statements executed")
+db_latency = registry.histogram("wealthsync_db_query_seconds", "SQL statement latency")
+db_queries_per_request = registry.histogram("wealthsync_db_queries_per_request", "SQL statements per HTTP request", ("route",), COUNT_BUCKETS)
+provider_latency = registry.histogram("wealthsync_provider_seconds", "Model call latency", ("provider", "model", "kind"))
+pdf_pages = registry.counter("wealthsync_pdf_pages_total", "PDF pages sent to the model as text or as scanned pages", ("kind",))
+pdf_upload_bytes_saved = registry.counter("wealthsync_pdf_upload_bytes_saved_total", "PDF bytes not uploaded thanks to the text layer")
+image_bytes = registry.counter("wealthsync_image_bytes_total", "Image bytes received and sent to the model after normalisation", ("stage",))
+image_duplicates = registry.counter("wealthsync_image_duplicates_total", "Near-duplicate images not sent to the model")
+provider_first_token = registry.histogram("wealthsync_provider_first_token_seconds", "Time to first streamed token", ("provider", "model"))
+provider_errors = registry.counter("wealthsync_provider_errors_total", "Failed model calls", ("provider", "model", "kind"))
+provider_tokens = registry.counter("wealthsync_provider_tokens_total", "Tokens reported by the provider", ("provider", "model", "type"))
+
+
+# --- Request Timings ---
+class RequestTimings:
+    __slots__ = ("spans", "db_queries", "db_seconds")
+
+    def __init__(self):
+        self.spans = {}
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+    def add(self, name: str, seconds: float):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self, total: float) -> str:
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.spans.items()]
+        entries.append(f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"')
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+# Set per request by MetricsMiddleware; copied into threadpool calls, so sync endpoints see it too
+current_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def span(name: str):
+    """Time a block into the stage histogram and, inside a request, its Server-Timing entry."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_latency.observe(elapsed, name)
+        timings = current_timings.get()
+        if timings is not None:
+            timings.add(name, elapsed)
+
+
+class StageTimer:
+    """Consecutive spans: entering a stage closes the previous one."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.current = None
+        self.started = 0.0
+
+    def enter(self, name: str):
+        self.close()
+        self.current = f"{self.prefix}_{name}"
+        self.started = time.perf_counter()
+
+    def close(self):
+        if self.current is None:
+            return
+        elapsed = time.perf_counter() - self.started
+        stage_latency.observe(elapsed, self.current)
+        timings = current_timings.get()
+        if timings is not None:
+            timings.add(self.current, elapsed)
+        self.current = None
+
+
+def record_usage(provider: str, model: str, input_tokens=None, output_tokens=None, cached_tokens=None):
+    for kind, count in (("input", input_tokens), ("output", output_tokens), ("cached", cached_tokens)):
+        if count:
+            provider_tokens.inc(provider, model, kind, amount=count)
+
+
+# --- Database ---
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    db_queries.inc()
+    db_latency.observe(elapsed)
+    timings = current_timings.get()
+    if timings is not None:
+        timings.db_queries += 1
+        timings.db_seconds += elapsed
+
+def _handle_error(exception_context):
+    stack = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if stack:
+        stack.pop()
+
+def instrument_engine(sync_engine):
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+# --- Cache Stats ---
+def cache_collector(caches: dict):
+    """Expose hit/miss counters from the existing stats() of each named cache."""
+    def collect_caches():
+        lines = [
+            "# HELP wealthsync_cache_hits_total Cache hits", "# TYPE wealthsync_cache_hits_total counter",
+            "# HELP wealthsync_cache_misses_total Cache misses", "# TYPE wealthsync_cache_misses_total counter",
+            "# HELP wealthsync_cache_entries Entries currently cached", "# TYPE wealthsync_cache_entries gauge",
+        ]
+        for name, stats in caches.items():
+            values = stats()
+            if "memory" in values: # analysis cache: memory tier + disk tier
+                tiers = {f"{name}_memory": values["memory"], f"{name}_disk": values["disk"]}
+            else:
+                tiers = {name: values}
+            for tier, tier_values in tiers.items():
+                lines.append(f'wealthsync_cache_hits_total{{cache="{tier}"}} {tier_values.get("hits", 0)}')
+                lines.append(f'wealthsync_cache_misses_total{{cache="{tier}"}} {tier_values.get("misses", 0)}')
+                if "size" in tier_values:
+                    lines.append(f'wealthsync_cache_entries{{cache="{tier}"}} {tier_values["size"]}')
+        return lines
+    registry.collector(collect_caches)
+
+
+# --- Startup ---
+startup_phases = {} # cold-start phase -> seconds for this process, in the order they ran
+
+@contextmanager
+def startup_phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_phases[name] = time.perf_counter() - started
+
+@registry.collector
+def collect_startup():
+    lines = ["# HELP wealthsync_startup_seconds Cold-start time of this process by phase", "# TYPE wealthsync_startup_seconds gauge"]
+    lines.extend(f'wealthsync_startup_seconds{{phase="{phase}"}} {seconds:.6f}' for phase, seconds in startup_phases.items())
+    return lines
+
+
+# --- Middleware ---
+class MetricsMiddleware:
+    """Plain ASGI middleware, so streaming responses pass through untouched."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                elapsed = time.perf_counter() - started
+                route = _route(scope)
+                http_latency.observe(elapsed, scope["method"], route)
+                http_requests.inc(scope["method"], route, status_code)
+                db_queries_per_request.observe(timings.db_queries, route)
+                if SERVER_TIMING:
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"server-timing", timings.server_timing(elapsed).encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_timings.reset(token)
+
+
+def _route(scope) -> str:
+    # Route templates keep label cardinality bounded (/profiles/{profile_id}, not every id)
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
@@ -0,0 +1,147 @@
+import os
+import json
+import hashlib
+import datetime
+import contextlib
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import flag_modified
+from database import BASE_DIR
+from models import Base, ClientProfile, SchemaVersion
+from profile_index import index_profile, PROFILE_INDEX_VERSION
+from search_index import create_search_index, rebuild_search_index, SEARCH_INDEX_VERSION
+
+try:
+    import fcntl
+except ImportError: # Windows: single-worker dev servers only
+    fcntl = None
+
+# Held while migrating so workers booting together don't race on ALTER TABLE / seed inserts
+MIGRATION_LOCK_PATH = os.getenv("MIGRATION_LOCK_PATH", os.path.join(BASE_DIR, ".migration.lock"))
+# pg_advisory_lock key for Postgres, where workers may sit on different hosts
+MIGRATION_LOCK_ID = 0x5EA1_5C4E
+
+
+def add_missing_columns(engine):
+    """create_all() never alters existing tables; add columns introduced after a table was created."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                print(f"Migration: added {table.name}.{column.name}")
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
+def reindex_profiles(session_factory, batch_size: int = 200):
+    """Rebuild structured columns for rows indexed by an older PROFILE_INDEX_VERSION (or never)."""
+    db = session_factory()
+    try:
+        total = 0
+        while True:
+            stale = (
+                db.query(ClientProfile)
+                .options(selectinload(ClientProfile.assets), selectinload(ClientProfile.category_totals), selectinload(ClientProfile.goals))
+                .filter((ClientProfile.index_version == None) | (ClientProfile.index_version < PROFILE_INDEX_VERSION))
+                .limit(batch_size)
+                .all()
+            )
+            if not stale:
+                break
+            for profile in stale:
+                try:
+                    data = json.loads(profile.data or "{}")
+                except ValueError:
+                    data = {}
+                index_profile(profile, data if isinstance(data, dict) else {})
+                # Keep the original timestamp; a backfill is not a user edit
+                flag_modified(profile, "updated_at")
+            db.commit()
+            total += len(stale)
+        if total:
+            print(f"Migration: indexed {total} profiles")
+    finally:
+        db.close()
+
+
+def schema_fingerprint() -> str:
+    """Changes whenever a table, column, index, PROFILE_INDEX_VERSION or SEARCH_INDEX_VERSION changes."""
+    parts = [f"index:{PROFILE_INDEX_VERSION}", f"search:{SEARCH_INDEX_VERSION}"]
+    for table in Base.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f"{column.name}:{column.type}" for column in table.columns)
+        parts.extend(sorted(str(index.name) for index in table.indexes))
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def applied_fingerprint(engine):
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT fingerprint FROM schema_version WHERE id = 1")).scalar()
+    except DBAPIError:
+        # No schema_version table yet
+        return None
+
+
+@contextlib.contextmanager
+def migration_lock(engine):
+    """Exclusive across processes: an advisory lock on Postgres, a lock file otherwise."""
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+        return
+    with open(MIGRATION_LOCK_PATH, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def upgrade_schema(engine, session_factory, seed=None) -> bool:
+    """Create/alter tables, backfill the index and seed, once per schema change.
+
+    A database already at the current fingerprint costs a single query, so scaled-up
+    workers skip the inspector round trips entirely. Returns whether anything ran.
+    """
+    fingerprint = schema_fingerprint()
+    if applied_fingerprint(engine) == fingerprint:
+        return False
+    with migration_lock(engine):
+        # Another worker may have finished the migration while we waited
+        if applied_fingerprint(engine) == fingerprint:
+            return False
+        _migrate(engine, session_factory, fingerprint, seed)
+    return True
+
+
+def _migrate(engine, session_factory, fingerprint: str, seed=None):
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
+    reindex_profiles(session_factory)
+    create_search_index(engine)
+    rebuild_search_index(session_factory)
+    if seed is not None:
+        seed()
+    db = session_factory()
+    try:
+        db.merge(SchemaVersion(id=1, fingerprint=fingerprint, applied_at=datetime.datetime.utcnow()))
+        db.commit()
+    finally:
+        db.close()
+    print(f"Migration: schema at {fingerprint[:12]}")
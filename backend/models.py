@@ -0,0 +1,127 @@
+import datetime
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, Boolean, UniqueConstraint
+from sqlalchemy.orm import declarative_base, relationship
+
+Base = declarative_base()
+
+class User(Base):
+    __tablename__ = "users"
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, unique=True, index=True)
+    hashed_password = Column(String)
+    role = Column(String, default="employee") # admin or employee
+    profiles = relationship("ClientProfile", back_populates="owner")
+
+class ClientProfile(Base):
+    __tablename__ = "profiles"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, index=True)
+    data = Column(Text) # JSON stored as string (raw analysis document)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True)
+    owner = relationship("User", back_populates="profiles")
+
+    # Hot fields extracted from `data` on save so they can be filtered and ranked in SQL
+    net_worth = Column(Float, index=True) # rupees, parsed from financial_snapshot.net_worth
+    net_worth_text = Column(String)
+    risk_tolerance = Column(String, index=True)
+    potential_rank = Column(Integer, index=True)
+    life_insurance_status = Column(String, index=True)
+    life_insurance_sufficient = Column(Boolean)
+    health_insurance_status = Column(String, index=True)
+    health_insurance_sufficient = Column(Boolean)
+    index_version = Column(Integer) # PROFILE_INDEX_VERSION the row was indexed with
+    version = Column(Integer) # latest ProfileVersion.version; NULL for rows saved before history existed
+
+    assets = relationship("ProfileAsset", back_populates="profile", cascade="all, delete-orphan", order_by="ProfileAsset.position")
+    category_totals = relationship("ProfileCategoryTotal", back_populates="profile", cascade="all, delete-orphan", order_by="ProfileCategoryTotal.position")
+    goals = relationship("ProfileGoal", back_populates="profile", cascade="all, delete-orphan", order_by="ProfileGoal.position")
+    versions = relationship("ProfileVersion", back_populates="profile", cascade="all, delete-orphan", passive_deletes=True, lazy="noload")
+
+class ProfileAsset(Base):
+    __tablename__ = "profile_assets"
+    id = Column(Integer, primary_key=True)
+    profile_id = Column(Integer, ForeignKey("profiles.id", ondelete="CASCADE"), index=True, nullable=False)
+    position = Column(Integer, nullable=False)
+    type = Column(String, index=True)
+    value_text = Column(String)
+    amount = Column(Float, index=True)
+    period = Column(String) # month/year for recurring amounts such as SIPs, NULL for a holding's value
+    description = Column(Text)
+    profile = relationship("ClientProfile", back_populates="assets")
+
+class ProfileCategoryTotal(Base):
+    __tablename__ = "profile_category_totals"
+    id = Column(Integer, primary_key=True)
+    profile_id = Column(Integer, ForeignKey("profiles.id", ondelete="CASCADE"), index=True, nullable=False)
+    position = Column(Integer, nullable=False)
+    type = Column(String, index=True)
+    total_text = Column(String)
+    amount = Column(Float)
+    period = Column(String)
+    profile = relationship("ClientProfile", back_populates="category_totals")
+
+class ProfileGoal(Base):
+    __tablename__ = "profile_goals"
+    id = Column(Integer, primary_key=True)
+    profile_id = Column(Integer, ForeignKey("profiles.id", ondelete="CASCADE"), index=True, nullable=False)
+    position = Column(Integer, nullable=False)
+    goal = Column(Text)
+    timeline = Column(String)
+    feasibility = Column(String, index=True)
+    profile = relationship("ClientProfile", back_populates="goals")
+
+class ProfileVersion(Base):
+    """One save of a profile: a full snapshot, or a JSON merge patch against the previous version."""
+    __tablename__ = "profile_versions"
+    __table_args__ = (UniqueConstraint("profile_id", "version"),)
+    id = Column(Integer, primary_key=True)
+    profile_id = Column(Integer, ForeignKey("profiles.id", ondelete="CASCADE"), index=True, nullable=False)
+    version = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False) # snapshot or patch
+    body = Column(Text, nullable=False)
+    author_id = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    profile = relationship("ClientProfile", back_populates="versions")
+
+class ChatSession(Base):
+    """A conversation about one profile by one user; older turns are folded into `summary`."""
+    __tablename__ = "chat_sessions"
+    id = Column(Integer, primary_key=True)
+    profile_id = Column(Integer, ForeignKey("profiles.id", ondelete="CASCADE"), index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    summary = Column(Text) # running summary of every message up to summarized_through
+    summarized_through = Column(Integer, default=0) # id of the last ChatMessage folded into the summary
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, ForeignKey("chat_sessions.id", ondelete="CASCADE"), index=True, nullable=False)
+    role = Column(String, nullable=False) # user or assistant
+    content = Column(Text, nullable=False)
+    tokens = Column(Integer) # estimated, for the history budget
+    model = Column(String) # model that produced an assistant turn
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class AnalysisJob(Base):
+    """A background analysis job. Run by the worker process that accepted it; readable from any worker."""
+    __tablename__ = "analysis_jobs"
+    id = Column(String, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    kind = Column(String)
+    state = Column(String) # queued, running, succeeded or failed
+    status = Column(Text) # JSON of Job.status()
+    result = Column(Text) # JSON, once succeeded
+    worker = Column(String) # WORKER_ID of the process running it
+    heartbeat_at = Column(Float) # refreshed by that process while the job is unfinished
+    finished_at = Column(Float, index=True)
+
+class SchemaVersion(Base):
+    """Single row recording which schema/index fingerprint the database was last migrated to."""
+    __tablename__ = "schema_version"
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(String)
+    applied_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -0,0 +1,79 @@
+import io
+import os
+import asyncio
+from typing import NamedTuple, Optional
+from ttl_cache import TTLCache
+from workers import ProcessPool, preprocess_pool
+
+# A page with fewer extractable characters than this is treated as scanned and goes to the model as a PDF.
+PDF_MIN_PAGE_CHARS = int(os.getenv("PDF_MIN_PAGE_CHARS", "80"))
+PDF_CACHE_ENTRIES = int(os.getenv("PDF_CACHE_ENTRIES", "256"))
+PDF_CACHE_TTL = float(os.getenv("PDF_CACHE_TTL", str(24 * 3600)))
+
+
+class PdfPages(NamedTuple):
+    texts: list # extracted text per page ("" for scanned pages)
+    scanned: list # indices of pages without a usable text layer
+    scanned_pdf: Optional[bytes] # just the scanned pages, when only some pages are scanned
+
+    @property
+    def page_count(self) -> int:
+        return len(self.texts)
+
+    def text(self) -> str:
+        return "\n".join(f"[Page {i + 1}]\n{text}" for i, text in enumerate(self.texts) if text)
+
+
+def split_pdf(file_content: bytes) -> PdfPages:
+    """Runs in a worker process: text per page, plus a sub-PDF of the pages that have none."""
+    # Imported here so only the worker processes load pypdf
+    from pypdf import PdfReader, PdfWriter
+    reader = PdfReader(io.BytesIO(file_content))
+    texts, scanned = [], []
+    for i, page in enumerate(reader.pages):
+        text = (page.extract_text() or "").strip()
+        if len(text) < PDF_MIN_PAGE_CHARS:
+            scanned.append(i)
+            text = ""
+        texts.append(text)
+    scanned_pdf = None
+    if scanned and len(scanned) < len(texts):
+        writer = PdfWriter()
+        for i in scanned:
+            writer.add_page(reader.pages[i])
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        scanned_pdf = buffer.getvalue()
+    return PdfPages(texts, scanned, scanned_pdf)
+
+
+class PdfPreprocessor:
+    """pypdf extraction on the preprocessing pool, with results cached by file content hash."""
+
+    def __init__(self, pool: ProcessPool = preprocess_pool):
+        self.pool = pool
+        self.cache = TTLCache(maxsize=PDF_CACHE_ENTRIES, ttl=PDF_CACHE_TTL)
+        self.failures = 0
+
+    async def split(self, stream, digest: str) -> Optional[PdfPages]:
+        """Per-page text for the PDF, or None if it can't be parsed (encrypted, corrupt)."""
+        pages = self.cache.get(digest)
+        if pages is not None:
+            return pages
+        stream.seek(0)
+        data = await asyncio.to_thread(stream.read)
+        stream.seek(0)
+        try:
+            pages = await self.pool.run(split_pdf, data)
+        except Exception as e:
+            print(f"PDF preprocessing failed, uploading as-is: {e}")
+            self.failures += 1
+            return None
+        self.cache.set(digest, pages)
+        return pages
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "failures": self.failures}
+
+
+pdf_preprocessor = PdfPreprocessor()
@@ -0,0 +1,87 @@
+from amounts import parse_amount, parse_amount_detail
+from models import ClientProfile, ProfileAsset, ProfileCategoryTotal, ProfileGoal
+
+# Bump when extraction rules change; rows indexed with an older version are rebuilt on startup.
+PROFILE_INDEX_VERSION = 2
+
+
+def _dict(value) -> dict:
+    return value if isinstance(value, dict) else {}
+
+
+def _list(value) -> list:
+    return value if isinstance(value, list) else []
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _rank(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    return None
+
+
+def _period(value):
+    amount = parse_amount_detail(value)
+    return amount.period if amount else None
+
+
+def index_profile(profile: ClientProfile, data: dict):
+    """Copy the queryable parts of an analysis document onto the profile row and its child tables."""
+    client = _dict(data.get("client_profile"))
+    snapshot = _dict(data.get("financial_snapshot"))
+    insurance = _dict(data.get("insurance_analysis"))
+    life = _dict(insurance.get("life_insurance"))
+    health = _dict(insurance.get("health_insurance"))
+
+    profile.net_worth_text = _text(snapshot.get("net_worth"))
+    profile.net_worth = parse_amount(snapshot.get("net_worth"))
+    profile.risk_tolerance = _text(client.get("risk_tolerance"))
+    profile.potential_rank = _rank(client.get("potential_rank"))
+    profile.life_insurance_status = _text(life.get("status"))
+    profile.life_insurance_sufficient = _bool(life.get("is_sufficient"))
+    profile.health_insurance_status = _text(health.get("status"))
+    profile.health_insurance_sufficient = _bool(health.get("is_sufficient"))
+
+    profile.assets = [
+        ProfileAsset(
+            position=i,
+            type=_text(asset.get("type")),
+            value_text=_text(asset.get("value")),
+            amount=parse_amount(asset.get("value")),
+            period=_period(asset.get("value")),
+            description=_text(asset.get("description")),
+        )
+        for i, asset in enumerate(_list(data.get("assets_detail"))) if isinstance(asset, dict)
+    ]
+    profile.category_totals = [
+        ProfileCategoryTotal(
+            position=i,
+            type=_text(total.get("type")),
+            total_text=_text(total.get("total_value")),
+            amount=parse_amount(total.get("total_value")),
+            period=_period(total.get("total_value")),
+        )
+        for i, total in enumerate(_list(data.get("category_totals"))) if isinstance(total, dict)
+    ]
+    profile.goals = [
+        ProfileGoal(
+            position=i,
+            goal=_text(goal.get("goal")),
+            timeline=_text(goal.get("timeline")),
+            feasibility=_text(goal.get("feasibility")),
+        )
+        for i, goal in enumerate(_list(data.get("goals_detected"))) if isinstance(goal, dict)
+    ]
+    profile.index_version = PROFILE_INDEX_VERSION
@@ -0,0 +1,103 @@
+import os
+import gzip
+import datetime
+import threading
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from ttl_cache import TTLCache
+
+# Serialized profile documents kept in memory, one entry per profile (replaced when it changes)
+PROFILE_PAYLOAD_ENTRIES = int(os.getenv("PROFILE_PAYLOAD_ENTRIES", "512"))
+# Bodies smaller than this are sent uncompressed; the framing overhead isn't worth it
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+try: # in requirements.txt; without it responses fall back to gzip
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def profile_etag(profile_id: int, version: Optional[int], updated_at: Optional[datetime.datetime]) -> str:
+    # Weak: the same tag covers the identity, gzip and br encodings of one profile version
+    stamp = int(updated_at.timestamp() * 1e6) if updated_at else 0
+    return f'W/"p{profile_id}-v{version or 0}-{stamp:x}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def not_modified(headers, etag: str, last_modified: Optional[datetime.datetime]) -> bool:
+    """RFC 9110 conditional GET: If-None-Match wins; If-Modified-Since only when it is absent."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since.replace(tzinfo=None)
+    return False
+
+
+def http_date(value: datetime.datetime) -> str:
+    # Stored timestamps are naive UTC
+    return format_datetime(value.replace(tzinfo=datetime.timezone.utc), usegmt=True)
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    encodings = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        q = params.strip().removeprefix("q=")
+        try:
+            if params and float(q) <= 0:
+                continue # "gzip;q=0" means "not gzip"
+        except ValueError:
+            pass
+        encodings.add(name.strip())
+    return encodings
+
+
+class ProfilePayload:
+    """One profile version's JSON body, with each compressed encoding built on first request."""
+
+    def __init__(self, etag: str, last_modified: Optional[datetime.datetime], body: bytes):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = body
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encode(self, accept_encoding: str) -> tuple:
+        """(content, content_encoding or None) for the client's Accept-Encoding."""
+        if len(self.body) < COMPRESS_MIN_BYTES:
+            return self.body, None
+        accepted = accepted_encodings(accept_encoding)
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            return self.body, None
+        content = self._encoded.get(encoding)
+        if content is None:
+            with self._lock:
+                content = self._encoded.get(encoding)
+                if content is None:
+                    if encoding == "br":
+                        content = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                    else:
+                        content = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+                    self._encoded[encoding] = content
+        return content, encoding
+
+
+profile_payloads = TTLCache(maxsize=PROFILE_PAYLOAD_ENTRIES)
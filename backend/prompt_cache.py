@@ -0,0 +1,117 @@
+import os
+import asyncio
+import hashlib
+import datetime
+import threading
+from typing import NamedTuple, Optional
+from sdk import gemini
+from ttl_cache import TTLCache
+
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))
+# Gemini rejects cached contents below a model-dependent token floor; don't bother under it.
+GEMINI_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "4096"))
+# After a failed create, wait this long before trying to cache the same prefix again.
+GEMINI_CACHE_RETRY_AFTER = int(os.getenv("GEMINI_CACHE_RETRY_AFTER", "600"))
+
+GROUNDING_TOOLS = [{"google_search_retrieval": {}}]
+
+
+class ChatContext(NamedTuple):
+    """The stable part of a chat prompt: shared instructions followed by one client's vault.
+
+    Providers put this prefix first and the user turn last, so repeated questions about the
+    same client reuse the provider-side prompt cache.
+    """
+    instructions: str
+    vault: str
+    profile_id: Optional[int] = None
+    tools: bool = True # Google Search grounding on Gemini; off for internal calls such as summaries
+
+    @property
+    def system_prompt(self) -> str:
+        return f"{self.instructions}\n{self.vault}"
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha256(self.system_prompt.encode("utf-8")).hexdigest()[:32]
+
+    def estimated_tokens(self) -> int:
+        return len(self.system_prompt) // 4
+
+
+class PromptCacheRegistry:
+    """Tracks Gemini CachedContent handles per (model, prompt prefix) and per profile."""
+
+    def __init__(self, maxsize: int = 512):
+        self.handles = TTLCache(maxsize=maxsize, ttl=max(GEMINI_CACHE_TTL - 60, 60))
+        self.failures = TTLCache(maxsize=maxsize, ttl=GEMINI_CACHE_RETRY_AFTER)
+        self.created = 0
+        self._by_profile = {}
+        self._lock = threading.Lock()
+        self._creating = {}
+
+    def _create(self, model_name: str, context: ChatContext):
+        try:
+            return gemini().caching.CachedContent.create(
+                model=model_name,
+                system_instruction=context.instructions,
+                contents=[context.vault],
+                tools=GROUNDING_TOOLS,
+                ttl=datetime.timedelta(seconds=GEMINI_CACHE_TTL),
+            )
+        except Exception as e:
+            # Same grounding-tool fallback as uncached calls
+            if "google_search_retrieval is not supported" in str(e) or "400" in str(e):
+                return gemini().caching.CachedContent.create(
+                    model=model_name,
+                    system_instruction=context.instructions,
+                    contents=[context.vault],
+                    ttl=datetime.timedelta(seconds=GEMINI_CACHE_TTL),
+                )
+            raise
+
+    async def gemini_model(self, model_name: str, context: ChatContext):
+        """A GenerativeModel bound to cached instructions + vault, or None to send them inline."""
+        if context.estimated_tokens() < GEMINI_CACHE_MIN_TOKENS:
+            return None
+        cache_id = (model_name, context.key)
+        cached = self.handles.get(cache_id)
+        if cached is None:
+            if self.failures.get(cache_id):
+                return None
+            task = self._creating.get(cache_id)
+            if task is None:
+                task = asyncio.ensure_future(asyncio.to_thread(self._create, model_name, context))
+                self._creating[cache_id] = task
+                task.add_done_callback(lambda _: self._creating.pop(cache_id, None))
+            try:
+                cached = await asyncio.shield(task)
+            except Exception as e:
+                print(f"Prompt cache: could not cache prefix for {model_name}: {e}")
+                self.failures.set(cache_id, True)
+                return None
+            self.created += 1
+            self.handles.set(cache_id, cached)
+            if context.profile_id is not None:
+                with self._lock:
+                    self._by_profile.setdefault(context.profile_id, set()).add(cache_id)
+        return gemini().GenerativeModel.from_cached_content(cached)
+
+    def invalidate_profile(self, profile_id: int):
+        """Drop (and delete remotely) every cached prefix built from an older version of the profile."""
+        with self._lock:
+            cache_ids = self._by_profile.pop(profile_id, set())
+        for cache_id in cache_ids:
+            cached = self.handles.pop(cache_id)
+            if cached is None:
+                continue
+            try:
+                cached.delete()
+            except Exception as e:
+                print(f"Prompt cache: delete failed for {cached.name}: {e}")
+
+    def stats(self) -> dict:
+        return {**self.handles.stats(), "created": self.created, "profiles": len(self._by_profile)}
+
+
+prompt_cache = PromptCacheRegistry()
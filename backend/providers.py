@@ -0,0 +1,289 @@
+import os
+import time
+import asyncio
+from sdk import load_sdk, gemini
+from prompt_cache import prompt_cache, ChatContext, GROUNDING_TOOLS
+from metrics import span, record_usage, provider_latency, provider_errors, provider_first_token
+
+# --- Model Catalogue ---
+# UI label -> provider model id
+MODEL_MAP = {
+    "Gemini 3.1 Pro (Latest)": "gemini-3.1-pro-preview",
+    "Gemini 3 Flash": "gemini-3-flash-preview",
+    "Gemini 2.5 Pro": "gemini-2.5-pro",
+    "Gemini 2.5 Flash": "gemini-2.5-flash",
+    "o3-mini (OpenAI Reasoning)": "o3-mini",
+    "o1 (High Logic)": "o1-preview",
+    "GPT-4o (Standard)": "gpt-4o",
+    "Claude 3.5 Sonnet": "claude-3-5-sonnet-20241022",
+    "Qwen Max": "qwen-max"
+}
+DEFAULT_MODEL = "gemini-3.1-pro"
+
+QWEN_BASE_URL = os.getenv("QWEN_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+PROVIDER_TIMEOUT = float(os.getenv("PROVIDER_TIMEOUT", "300"))
+
+# Max in-flight calls per provider; excess requests wait on the semaphore instead of
+# piling onto the upstream rate limit.
+PROVIDER_CONCURRENCY = {
+    "gemini": int(os.getenv("GEMINI_MAX_CONCURRENCY", "16")),
+    "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY", "16")),
+    "anthropic": int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "8")),
+    "qwen": int(os.getenv("QWEN_MAX_CONCURRENCY", "8")),
+}
+
+PROVIDER_KEYS = {
+    "gemini": "GEMINI_API_KEY",
+    "openai": "OPENAI_API_KEY",
+    "anthropic": "ANTHROPIC_API_KEY",
+    "qwen": "QWEN_API_KEY",
+}
+
+MISSING_KEY_MESSAGES = {
+    "openai": "⚠️ OpenAI API key missing. Please add OPENAI_API_KEY to your .env file.",
+    "anthropic": "⚠️ Anthropic API key missing. Please add ANTHROPIC_API_KEY to your .env file.",
+    "qwen": "⚠️ Qwen API key missing. Please add QWEN_API_KEY to your .env file.",
+}
+
+
+class ProviderKeyMissing(Exception):
+    pass
+
+
+def resolve_model(label: str) -> str:
+    return MODEL_MAP.get(label, DEFAULT_MODEL)
+
+
+def record_gemini_usage(model_name: str, response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        record_usage("gemini", model_name, usage.prompt_token_count, usage.candidates_token_count,
+                     usage.cached_content_token_count)
+
+
+def provider_for(model_name: str) -> str | None:
+    if "gemini" in model_name:
+        return "gemini"
+    if any(x in model_name for x in ["gpt", "o1", "o3"]):
+        return "openai"
+    if "claude" in model_name:
+        return "anthropic"
+    if "qwen" in model_name:
+        return "qwen"
+    return None
+
+
+class ProviderPool:
+    """Async SDK clients created once per process and shared by every request.
+
+    Each client keeps its own keep-alive connection pool, so repeated calls reuse
+    open TLS connections instead of handshaking per request. Clients (and their SDKs)
+    are created on the first call to each provider, not at startup.
+    """
+
+    def __init__(self):
+        self.clients = {}
+        self.keys = {}
+        self.limits = {name: asyncio.Semaphore(n) for name, n in PROVIDER_CONCURRENCY.items()}
+
+    def startup(self):
+        self.keys = {provider: os.getenv(env) for provider, env in PROVIDER_KEYS.items() if os.getenv(env)}
+
+    async def shutdown(self):
+        for client in self.clients.values():
+            await client.close()
+        self.clients.clear()
+
+    def available(self, provider: str) -> bool:
+        return provider in self.keys
+
+    def _client(self, provider: str):
+        client = self.clients.get(provider)
+        if client is None:
+            if provider not in self.keys:
+                raise ProviderKeyMissing(MISSING_KEY_MESSAGES[provider])
+            client = self.clients[provider] = self._create_client(provider)
+        return client
+
+    def _create_client(self, provider: str):
+        if provider == "anthropic":
+            return load_sdk("anthropic").AsyncAnthropic(api_key=self.keys[provider], timeout=PROVIDER_TIMEOUT)
+        base_url = QWEN_BASE_URL if provider == "qwen" else None
+        return load_sdk("openai").AsyncOpenAI(api_key=self.keys[provider], base_url=base_url, timeout=PROVIDER_TIMEOUT)
+
+    async def complete(self, model_name: str, context: ChatContext, message: str) -> str:
+        provider = provider_for(model_name)
+        if provider is None:
+            raise ValueError("Model selection error. Unknown provider.")
+        started = time.perf_counter()
+        try:
+            with span("provider"):
+                async with self.limits[provider]:
+                    if provider == "gemini":
+                        response = await self._gemini_call(model_name, context, message)
+                        record_gemini_usage(model_name, response)
+                        return response.text
+                    if provider == "anthropic":
+                        return await self._anthropic_chat(model_name, context, message)
+                    return await self._openai_chat(provider, model_name, context, message)
+        except ProviderKeyMissing:
+            raise
+        except Exception:
+            provider_errors.inc(provider, model_name, "complete")
+            raise
+        finally:
+            provider_latency.observe(time.perf_counter() - started, provider, model_name, "complete")
+
+    async def _gemini_call(self, model_name, context, message, stream=False):
+        if not context.tools:
+            model = gemini().GenerativeModel(model_name=model_name)
+            return await model.generate_content_async([context.system_prompt, message], stream=stream)
+        # Long vaults are served from a Gemini cached content (instructions + vault + tools)
+        cached_model = await prompt_cache.gemini_model(model_name, context)
+        if cached_model is not None:
+            return await cached_model.generate_content_async([message], stream=stream)
+        # Enable Google Search Grounding for Gemini Pro/Flash
+        # Newer models (2025/2026) require 'google_search' tool instead of 'google_search_retrieval'
+        # If the current SDK doesn't support the rename, we catch the 400 and fall back.
+        try:
+            model = gemini().GenerativeModel(model_name=model_name, tools=GROUNDING_TOOLS)
+            return await model.generate_content_async([context.system_prompt, message], stream=stream)
+        except Exception as e:
+            if "google_search_retrieval is not supported" in str(e) or "400" in str(e):
+                # Fallback to call without tools if grounding is cause of failure
+                model = gemini().GenerativeModel(model_name=model_name)
+                return await model.generate_content_async([context.system_prompt, message], stream=stream)
+            raise e
+
+    def _openai_request(self, provider, model_name, context, message) -> dict:
+        # o1 and o1-mini use 'developer' role instead of 'system' for core instructions
+        role = "developer" if provider == "openai" and model_name.startswith("o") else "system"
+        request = {
+            "model": model_name,
+            # Instructions + vault first and byte-identical across turns, so OpenAI's automatic
+            # prefix caching applies; only the trailing user turn changes.
+            "messages": [
+                {"role": role, "content": context.system_prompt},
+                {"role": "user", "content": message}
+            ]
+        }
+        if provider == "openai":
+            # Routes requests sharing this prefix to the same cache shard
+            request["extra_body"] = {"prompt_cache_key": context.key}
+        return request
+
+    async def _openai_chat(self, provider, model_name, context, message):
+        client = self._client(provider)
+        response = await client.chat.completions.create(**self._openai_request(provider, model_name, context, message))
+        self._record_openai_usage(provider, model_name, response.usage)
+        return response.choices[0].message.content
+
+    def _record_openai_usage(self, provider, model_name, usage):
+        if usage:
+            details = getattr(usage, "prompt_tokens_details", None)
+            record_usage(provider, model_name, usage.prompt_tokens, usage.completion_tokens,
+                         getattr(details, "cached_tokens", None))
+
+    def _anthropic_request(self, model_name, context, message) -> dict:
+        system = [{"type": "text", "text": context.instructions}]
+        if context.vault:
+            # The breakpoint on the vault block caches instructions + vault together.
+            # Anthropic rejects empty text blocks, so vault-less calls (summaries) send instructions only.
+            system.append({"type": "text", "text": context.vault, "cache_control": {"type": "ephemeral"}})
+        return {
+            "model": model_name,
+            "max_tokens": 2048,
+            "system": system,
+            "messages": [{"role": "user", "content": message}]
+        }
+
+    async def _anthropic_chat(self, model_name, context, message):
+        client = self._client("anthropic")
+        response = await client.messages.create(**self._anthropic_request(model_name, context, message))
+        self._record_anthropic_usage(model_name, response.usage)
+        return response.content[0].text
+
+    def _record_anthropic_usage(self, model_name, usage):
+        if usage:
+            record_usage("anthropic", model_name, usage.input_tokens, usage.output_tokens,
+                         getattr(usage, "cache_read_input_tokens", None))
+
+    # --- Streaming ---
+    async def stream(self, model_name: str, context: ChatContext, message: str):
+        """Yield text deltas as the provider produces them."""
+        provider = provider_for(model_name)
+        if provider is None:
+            raise ValueError("Model selection error. Unknown provider.")
+        started = time.perf_counter()
+        first_token = None
+        try:
+            async with self.limits[provider]:
+                if provider == "gemini":
+                    chunks = self._gemini_stream(model_name, context, message)
+                elif provider == "anthropic":
+                    chunks = self._anthropic_stream(model_name, context, message)
+                else:
+                    chunks = self._openai_stream(provider, model_name, context, message)
+                async for text in chunks:
+                    if text:
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                            provider_first_token.observe(first_token, provider, model_name)
+                        yield text
+        except ProviderKeyMissing:
+            raise
+        except Exception:
+            provider_errors.inc(provider, model_name, "stream")
+            raise
+        finally:
+            provider_latency.observe(time.perf_counter() - started, provider, model_name, "stream")
+
+    async def _gemini_stream(self, model_name, context, message):
+        response = await self._gemini_call(model_name, context, message, stream=True)
+        last_chunk = None
+        async for chunk in response:
+            last_chunk = chunk
+            # Chunks carrying only grounding metadata have no text parts
+            if chunk.parts:
+                yield chunk.text
+        # Usage totals arrive on the final chunk
+        record_gemini_usage(model_name, last_chunk)
+
+    async def _openai_stream(self, provider, model_name, context, message):
+        client = self._client(provider)
+        response = await client.chat.completions.create(
+            **self._openai_request(provider, model_name, context, message),
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            # The last chunk has no choices, only usage
+            if getattr(chunk, "usage", None):
+                self._record_openai_usage(provider, model_name, chunk.usage)
+
+    async def _anthropic_stream(self, model_name, context, message):
+        client = self._client("anthropic")
+        async with client.messages.stream(**self._anthropic_request(model_name, context, message)) as response:
+            async for text in response.text_stream:
+                yield text
+            final = await response.get_final_message()
+            self._record_anthropic_usage(model_name, final.usage)
+
+    async def gemini_generate(self, contents, model_name: str = "gemini-2.0-flash", generation_config=None):
+        started = time.perf_counter()
+        try:
+            async with self.limits["gemini"]:
+                model = gemini().GenerativeModel(model_name=model_name, generation_config=generation_config)
+                response = await model.generate_content_async(contents)
+        except Exception:
+            provider_errors.inc("gemini", model_name, "generate")
+            raise
+        finally:
+            provider_latency.observe(time.perf_counter() - started, "gemini", model_name, "generate")
+        record_gemini_usage(model_name, response)
+        return response
+
+
+providers = ProviderPool()
@@ -0,0 +1,320 @@
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from providers import provider_for, ProviderKeyMissing
+
+# Ordered fallbacks per model; override with MODEL_FALLBACKS='{"model": ["fallback", ...]}'
+DEFAULT_FALLBACKS = {
+    "gemini-3.1-pro-preview": ["gemini-2.5-pro", "gpt-4o"],
+    "gemini-3-flash-preview": ["gemini-2.5-flash", "gpt-4o"],
+    "gemini-2.5-pro": ["gemini-2.5-flash", "gpt-4o"],
+    "gemini-2.5-flash": ["gemini-3-flash-preview", "gpt-4o"],
+    "o3-mini": ["gpt-4o", "gemini-2.5-pro"],
+    "o1-preview": ["o3-mini", "gemini-2.5-pro"],
+    "gpt-4o": ["gemini-2.5-pro", "claude-3-5-sonnet-20241022"],
+    "claude-3-5-sonnet-20241022": ["gpt-4o", "gemini-2.5-pro"],
+    "qwen-max": ["gemini-2.5-flash", "gpt-4o"],
+}
+MODEL_FALLBACKS = {**DEFAULT_FALLBACKS, **json.loads(os.getenv("MODEL_FALLBACKS", "{}"))}
+
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", "50"))
+# Hedge: if the first choice hasn't answered (or, for streams, produced a first token) within
+# this many seconds, start the next healthy model and keep whichever answers first.
+# 0 disables hedging. When unset, each model's rolling p95 is used (bounded below).
+HEDGE_AFTER = os.getenv("HEDGE_AFTER_SECONDS")
+HEDGE_MIN_SECONDS = float(os.getenv("HEDGE_MIN_SECONDS", "8"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_MIN_SAMPLES = int(os.getenv("BREAKER_MIN_SAMPLES", "10"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "30"))
+
+
+class NoHealthyModel(Exception):
+    pass
+
+
+class ModelHealth:
+    """Rolling latency/error window and circuit breaker for one model."""
+
+    def __init__(self):
+        self.samples = deque(maxlen=ROUTER_WINDOW) # (latency seconds, ok)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= BREAKER_COOLDOWN:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        # After the cool-down a single trial request decides whether to close again
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record(self, latency: float, ok: bool):
+        self.samples.append((latency, ok))
+        self.trial_in_flight = False
+        if ok:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            return
+        self.consecutive_failures += 1
+        errors = sum(1 for _, success in self.samples if not success)
+        error_rate = errors / len(self.samples)
+        if self.state == "half_open" or self.consecutive_failures >= BREAKER_FAILURES or \
+                (len(self.samples) >= BREAKER_MIN_SAMPLES and error_rate >= BREAKER_ERROR_RATE):
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        # Cancelled (hedge loser) calls say nothing about health
+        self.trial_in_flight = False
+
+    def percentile(self, q: float):
+        latencies = sorted(latency for latency, ok in self.samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def snapshot(self) -> dict:
+        total = len(self.samples)
+        errors = sum(1 for _, ok in self.samples if not ok)
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "state": self.state,
+            "samples": total,
+            "error_rate": round(errors / total, 3) if total else 0.0,
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class ModelRouter:
+    """Chooses, hedges and falls back between models in front of the provider pool."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.health = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+
+    def _health(self, model_name: str) -> ModelHealth:
+        if model_name not in self.health:
+            self.health[model_name] = ModelHealth()
+        return self.health[model_name]
+
+    def candidates(self, model_name: str) -> list:
+        """The requested model followed by its configured fallbacks that have a key configured."""
+        chain = [model_name]
+        for fallback in MODEL_FALLBACKS.get(model_name, []):
+            provider = provider_for(fallback)
+            if provider and fallback not in chain and self.pool.available(provider):
+                chain.append(fallback)
+        return chain
+
+    def hedge_delay(self, model_name: str):
+        if HEDGE_AFTER is not None:
+            delay = float(HEDGE_AFTER)
+            return delay if delay > 0 else None
+        p95 = self._health(model_name).percentile(0.95)
+        return max(HEDGE_MIN_SECONDS, p95 * 1.5) if p95 is not None else None
+
+    def _pick(self, chain: list, start: int):
+        """Next model in chain (from index start) whose breaker lets traffic through."""
+        for i in range(start, len(chain)):
+            if self._health(chain[i]).allow():
+                return i
+        return None
+
+    async def _timed(self, model_name: str, call):
+        health = self._health(model_name)
+        started = time.monotonic()
+        try:
+            result = await call
+        except asyncio.CancelledError:
+            health.release()
+            raise
+        except ProviderKeyMissing:
+            health.release()
+            raise
+        except Exception:
+            health.record(time.monotonic() - started, ok=False)
+            raise
+        health.record(time.monotonic() - started, ok=True)
+        return result
+
+    # --- Unary ---
+    async def complete(self, model_name: str, context, message: str):
+        """Returns (text, model that answered)."""
+        chain = self.candidates(model_name)
+        next_index = 0
+        running = {} # task -> model
+        last_error = None
+
+        def launch(hedge: bool = False):
+            nonlocal next_index
+            index = self._pick(chain, next_index)
+            if index is None:
+                next_index = len(chain)
+                return False
+            next_index = index + 1
+            model = chain[index]
+            if hedge:
+                self.hedges += 1
+            elif index > 0:
+                self.fallbacks += 1
+            task = asyncio.ensure_future(self._timed(model, self.pool.complete(model, context, message)))
+            running[task] = model
+            return True
+
+        if not launch():
+            raise NoHealthyModel(f"No healthy model available for {model_name}")
+        try:
+            while running:
+                first_model = next(iter(running.values()))
+                delay = self.hedge_delay(first_model) if len(running) == 1 and next_index < len(chain) else None
+                done, _ = await asyncio.wait(running, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slow answer: hedge with the next healthy model, keep waiting on both
+                    launch(hedge=True)
+                    continue
+                for task in done:
+                    model = running.pop(task)
+                    try:
+                        text = task.result()
+                    except ProviderKeyMissing:
+                        # Only the requested model surfaces a missing key; fallbacks are pre-filtered
+                        if model == chain[0] and not running:
+                            raise
+                        continue
+                    except Exception as e:
+                        last_error = e
+                        print(f"Router: {model} failed: {e}")
+                        continue
+                    if model != chain[0] and len(running) > 0:
+                        self.hedge_wins += 1
+                    return text, model
+                # Every finished call failed: move down the chain if nothing else is in flight
+                if not running and not launch():
+                    break
+        finally:
+            for task in running:
+                task.cancel()
+        raise last_error or NoHealthyModel(f"No healthy model available for {model_name}")
+
+    # --- Streaming ---
+    async def _open_stream(self, model_name: str, context, message: str):
+        """Start a provider stream and wait for its first delta; returns (first_delta, iterator)."""
+        iterator = self.pool.stream(model_name, context, message).__aiter__()
+        try:
+            first = await iterator.__anext__()
+        except StopAsyncIteration:
+            first = ""
+        except BaseException:
+            await iterator.aclose()
+            raise
+        return first, iterator
+
+    async def stream(self, model_name: str, context, message: str):
+        """Yields ("model", name) once, then text deltas.
+
+        Hedging and fallback apply up to the first token; after that the stream is committed to
+        one model, since text already sent to the browser cannot be retracted.
+        """
+        chain = self.candidates(model_name)
+        next_index = 0
+        running = {} # task -> (model, started)
+        last_error = None
+        winner = None
+
+        def launch(hedge: bool = False):
+            nonlocal next_index
+            index = self._pick(chain, next_index)
+            if index is None:
+                next_index = len(chain)
+                return False
+            next_index = index + 1
+            if hedge:
+                self.hedges += 1
+            elif index > 0:
+                self.fallbacks += 1
+            task = asyncio.ensure_future(self._open_stream(chain[index], context, message))
+            running[task] = (chain[index], time.monotonic())
+            return True
+
+        if not launch():
+            raise NoHealthyModel(f"No healthy model available for {model_name}")
+        try:
+            while running and winner is None:
+                first_model = next(iter(running.values()))[0]
+                delay = self.hedge_delay(first_model) if len(running) == 1 and next_index < len(chain) else None
+                done, _ = await asyncio.wait(running, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch(hedge=True)
+                    continue
+                for task in done:
+                    model, started = running.pop(task)
+                    try:
+                        first, iterator = task.result()
+                    except ProviderKeyMissing:
+                        self._health(model).release()
+                        if model == chain[0] and not running:
+                            raise
+                        continue
+                    except Exception as e:
+                        self._health(model).record(time.monotonic() - started, ok=False)
+                        last_error = e
+                        print(f"Router: {model} failed before first token: {e}")
+                        continue
+                    if winner is None:
+                        winner = (model, started, first, iterator)
+                        if model != chain[0] and running:
+                            self.hedge_wins += 1
+                    else:
+                        # Lost the race: free its half-open trial slot, if it held one
+                        self._health(model).release()
+                        await iterator.aclose()
+                if winner is None and not running and not launch():
+                    break
+        finally:
+            # Cancelling a loser closes its provider stream inside _open_stream
+            for task in running:
+                task.cancel()
+                self._health(running[task][0]).release()
+
+        if winner is None:
+            raise last_error or NoHealthyModel(f"No healthy model available for {model_name}")
+
+        model, started, first, iterator = winner
+        yield ("model", model)
+        try:
+            if first:
+                yield first
+            async for delta in iterator:
+                yield delta
+        except Exception:
+            self._health(model).record(time.monotonic() - started, ok=False)
+            raise
+        finally:
+            await iterator.aclose()
+        self._health(model).record(time.monotonic() - started, ok=True)
+
+    def stats(self) -> dict:
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "models": {name: health.snapshot() for name, health in self.health.items()},
+        }
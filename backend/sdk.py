@@ -0,0 +1,44 @@
+import os
+import time
+import threading
+import importlib
+
+# Override to point Gemini at a local stand-in; OpenAI/Anthropic read OPENAI_BASE_URL / ANTHROPIC_BASE_URL.
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+# Importing the provider SDKs costs seconds of CPU (openai/anthropic build large pydantic type
+# trees, google.generativeai pulls in protobuf + gRPC). Each one is imported the first time its
+# provider is used, so a fresh worker only pays for what it serves.
+_lock = threading.RLock()
+_modules = {}
+import_seconds = {}
+_gemini_configured = False
+
+
+def load_sdk(name: str):
+    """Import a provider SDK module once, recording how long it took."""
+    module = _modules.get(name)
+    if module is not None:
+        return module
+    with _lock:
+        module = _modules.get(name)
+        if module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(name)
+            import_seconds[name] = time.perf_counter() - started
+            print(f"SDK: imported {name} in {import_seconds[name]:.2f}s")
+            _modules[name] = module
+    return module
+
+
+def gemini():
+    """google.generativeai, configured with GEMINI_API_KEY on first use."""
+    global _gemini_configured
+    genai = load_sdk("google.generativeai")
+    if not _gemini_configured:
+        with _lock:
+            if not _gemini_configured:
+                client_options = {"api_endpoint": GEMINI_API_ENDPOINT} if GEMINI_API_ENDPOINT else None
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"), client_options=client_options)
+                _gemini_configured = True
+    return genai
@@ -0,0 +1,200 @@
+import re
+import json
+from typing import Optional
+from sqlalchemy import text, and_, or_, select, func, literal_column, table, column
+from sqlalchemy.orm import Session
+from database import IS_SQLITE
+from models import ClientProfile, ProfileAsset, User
+
+# Bump when the extracted text changes; the whole index is rebuilt on the next startup migration.
+SEARCH_INDEX_VERSION = 1
+
+# Column order matters: SEARCH_WEIGHTS and snippet() refer to columns by position.
+SEARCH_COLUMNS = ("name", "assets", "goals", "risks", "meeting")
+SEARCH_WEIGHTS = (10.0, 5.0, 3.0, 3.0, 2.0)
+
+CREATE_SEARCH_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS profile_search USING fts5(
+    {", ".join(SEARCH_COLUMNS)},
+    tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+)
+"""
+
+
+def _dict(value) -> dict:
+    return value if isinstance(value, dict) else {}
+
+
+def _list(value) -> list:
+    return value if isinstance(value, list) else []
+
+
+def _join(*values) -> str:
+    return " ".join(str(v) for v in values if v not in (None, "", [], {}))
+
+
+def _insurance_text(kind: str, policy: dict) -> str:
+    if not policy:
+        return ""
+    parts = [f"{kind} insurance", policy.get("status"), policy.get("coverage_amount"), policy.get("gap_details")]
+    if policy.get("is_sufficient") is False or policy.get("gap_details"):
+        # So "health insurance gap" finds every flagged client, whatever wording the model used
+        parts.append(f"{kind} insurance gap")
+    return _join(*parts)
+
+
+def search_document(name: Optional[str], data: dict) -> dict:
+    """The searchable text of an analysis document, per FTS column."""
+    client = _dict(data.get("client_profile"))
+    personal = _dict(data.get("client_personal_details"))
+    address = _dict(personal.get("residential_address"))
+    insurance = _dict(data.get("insurance_analysis"))
+    meeting = _dict(data.get("meeting_analysis"))
+    return {
+        "name": _join(
+            name, client.get("name"), personal.get("full_name"), personal.get("occupation"), client.get("life_stage"),
+            address.get("city"), address.get("state"),
+            *(_join(m.get("name"), m.get("relation")) for m in _list(personal.get("family_tree")) if isinstance(m, dict)),
+        ),
+        "assets": _join(
+            *(_join(a.get("type"), a.get("value"), a.get("description")) for a in _list(data.get("assets_detail")) if isinstance(a, dict)),
+            *(_join(t.get("type"), t.get("total_value")) for t in _list(data.get("category_totals")) if isinstance(t, dict)),
+        ),
+        "goals": _join(
+            *(_join(g.get("goal"), g.get("timeline")) for g in _list(data.get("goals_detected")) if isinstance(g, dict)),
+            *(_join(s.get("action"), s.get("reasoning")) for s in _list(data.get("strategic_roadmap")) if isinstance(s, dict)),
+        ),
+        "risks": _join(
+            client.get("risk_tolerance"), *_list(data.get("key_risks")),
+            _insurance_text("life", _dict(insurance.get("life_insurance"))),
+            _insurance_text("health", _dict(insurance.get("health_insurance"))),
+            insurance.get("rm_suggestion"),
+        ),
+        "meeting": _join(
+            meeting.get("transcript_summary"), meeting.get("sentiment"), *_list(meeting.get("next_steps")),
+            *(_join(*_list(s.get("key_points"))) for s in _list(meeting.get("speakers")) if isinstance(s, dict)),
+        ),
+    }
+
+
+def fts_query(q: str) -> Optional[str]:
+    """Free text -> FTS5 query: every word must match, as a prefix ("jewel" finds "jewellery")."""
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+# --- Maintenance ---
+def create_search_index(engine):
+    if IS_SQLITE:
+        with engine.begin() as conn:
+            conn.execute(text(CREATE_SEARCH_TABLE))
+
+
+def update_search_index(db: Session, profile: ClientProfile, data: dict):
+    """Replace the profile's row in the index, in the caller's transaction (profile must be flushed)."""
+    if not IS_SQLITE:
+        return
+    document = search_document(profile.name, data)
+    db.execute(text("DELETE FROM profile_search WHERE rowid = :id"), {"id": profile.id})
+    db.execute(
+        text(f"INSERT INTO profile_search (rowid, {', '.join(SEARCH_COLUMNS)}) "
+             f"VALUES (:id, {', '.join(':' + c for c in SEARCH_COLUMNS)})"),
+        {"id": profile.id, **document},
+    )
+
+
+def rebuild_search_index(session_factory, batch_size: int = 200):
+    if not IS_SQLITE:
+        return
+    db = session_factory()
+    try:
+        db.execute(text("DELETE FROM profile_search"))
+        last_id, total = 0, 0
+        while True:
+            rows = (
+                db.query(ClientProfile.id, ClientProfile.name, ClientProfile.data)
+                .filter(ClientProfile.id > last_id)
+                .order_by(ClientProfile.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            for row in rows:
+                try:
+                    data = json.loads(row.data or "{}")
+                except ValueError:
+                    data = {}
+                update_search_index(db, row, data if isinstance(data, dict) else {})
+            last_id = rows[-1].id
+            total += len(rows)
+        db.execute(text("INSERT INTO profile_search (profile_search) VALUES ('optimize')"))
+        db.commit()
+        print(f"Migration: search index built for {total} profiles")
+    finally:
+        db.close()
+
+
+# --- Query ---
+search_table = table("profile_search", column("rowid"))
+SEARCH_TABLE = literal_column("profile_search")
+
+
+def asset_value_filter(min_asset_value: float, asset_period: Optional[str] = None):
+    # Compares like with like: holding values by default, or only recurring amounts of one
+    # period ("month"/"year"). profile_assets mirrors each profile's latest saved version.
+    period = ProfileAsset.period.is_(None) if asset_period is None else ProfileAsset.period == asset_period
+    return ClientProfile.assets.any(and_(ProfileAsset.amount >= min_asset_value, period))
+
+
+def search_profiles(db: Session, q: str, owner_id: Optional[int] = None, min_asset_value: Optional[float] = None,
+                    asset_period: Optional[str] = None, limit: int = 20, offset: int = 0) -> list:
+    """Ranked matches as dicts; owner_id restricts to one RM's book. Only the index and profile columns are read."""
+    match = fts_query(q)
+    if match is None:
+        return []
+    if not IS_SQLITE:
+        return _search_fallback(db, q, owner_id, min_asset_value, asset_period, limit, offset)
+    score = func.bm25(SEARCH_TABLE, *SEARCH_WEIGHTS).label("score")
+    query = (
+        select(
+            ClientProfile.id, ClientProfile.name, User.username, ClientProfile.updated_at, ClientProfile.net_worth_text,
+            score, func.snippet(SEARCH_TABLE, -1, "[", "]", "…", 12).label("snippet"),
+        )
+        .select_from(search_table)
+        .join(ClientProfile, ClientProfile.id == search_table.c.rowid)
+        .outerjoin(User, User.id == ClientProfile.owner_id)
+        .where(SEARCH_TABLE.op("MATCH")(match))
+    )
+    if owner_id is not None:
+        query = query.where(ClientProfile.owner_id == owner_id)
+    if min_asset_value is not None:
+        query = query.where(asset_value_filter(min_asset_value, asset_period))
+    rows = db.execute(query.order_by(score).offset(offset).limit(limit)).all()
+    return [
+        {
+            "id": id, "name": name, "owner": owner or "System", "updated_at": updated_at,
+            "net_worth_text": net_worth_text, "score": round(-score, 4), "snippet": snippet,
+        }
+        for id, name, owner, updated_at, net_worth_text, score, snippet in rows
+    ]
+
+
+def _search_fallback(db: Session, q: str, owner_id, min_asset_value, asset_period, limit: int, offset: int) -> list:
+    # Other databases: unranked substring match inside the database, newest first
+    query = db.query(ClientProfile.id, ClientProfile.name, User.username, ClientProfile.updated_at, ClientProfile.net_worth_text) \
+        .outerjoin(User, User.id == ClientProfile.owner_id)
+    for word in re.findall(r"\w+", q):
+        query = query.filter(or_(ClientProfile.name.ilike(f"%{word}%"), ClientProfile.data.ilike(f"%{word}%")))
+    if owner_id is not None:
+        query = query.filter(ClientProfile.owner_id == owner_id)
+    if min_asset_value is not None:
+        query = query.filter(asset_value_filter(min_asset_value, asset_period))
+    rows = query.order_by(ClientProfile.updated_at.desc()).offset(offset).limit(limit).all()
+    return [
+        {"id": id, "name": name, "owner": owner or "System", "updated_at": updated_at,
+         "net_worth_text": net_worth_text, "score": None, "snippet": None}
+        for id, name, owner, updated_at, net_worth_text in rows
+    ]
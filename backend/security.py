@@ -0,0 +1,55 @@
+import os
+import asyncio
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+from sqlalchemy import event, inspect
+from models import User
+from ttl_cache import TTLCache
+
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+# bcrypt releases the GIL, so a small thread pool is enough; it also caps how many
+# hashes run at once during a login burst.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+
+# --- Passwords ---
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+async def verify_password_async(plain_password, hashed_password):
+    return await asyncio.get_running_loop().run_in_executor(
+        _hash_executor, verify_password, plain_password, hashed_password
+    )
+
+
+# --- Principal Cache ---
+class Principal(NamedTuple):
+    """Detached view of the authenticated user; safe to share across requests."""
+    id: int
+    username: str
+    role: str
+
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+def principal_from_user(user: User) -> Principal:
+    return Principal(id=user.id, username=user.username, role=user.role)
+
+def invalidate_principal(username: str):
+    principal_cache.pop(username)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_on_change(mapper, connection, target):
+    # Role changes, renames and deletions take effect on the next request in this process;
+    # other workers pick them up within PRINCIPAL_CACHE_TTL.
+    invalidate_principal(target.username)
+    for old_username in inspect(target).attrs.username.history.deleted:
+        invalidate_principal(old_username)
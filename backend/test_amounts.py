@@ -0,0 +1,54 @@
+import pytest
+from amounts import parse_amount, parse_amount_detail
+
+
+@pytest.mark.parametrize("text, value", [
+    ("₹1.2 Cr", 12_000_000),
+    ("1 crore", 10_000_000),
+    ("45,00,000", 4_500_000),
+    ("12 Lakh", 1_200_000),
+    ("5 lacs", 500_000),
+    ("50K", 50_000),
+    ("2.5 million", 2_500_000),
+    ("Rs. 5000", 5_000),
+    ("INR 2500", 2_500),
+    ("-₹2,00,000", -200_000),
+    ("Approx ₹8 L in FDs", 800_000),
+    ("Age 45, ₹5 Lakh", 500_000),
+    (4_500_000, 4_500_000),
+    (12.5, 12.5),
+])
+def test_parse_amount(text, value):
+    assert parse_amount(text) == pytest.approx(value)
+
+
+@pytest.mark.parametrize("text, low, high", [
+    ("₹10-12 Lakh", 1_000_000, 1_200_000),
+    ("10-12 Lakh", 1_000_000, 1_200_000),
+    ("50K - 75K", 50_000, 75_000),
+    ("Rs 10 to 12 lakh", 1_000_000, 1_200_000),
+    ("between 5 and 7 Cr", 50_000_000, 70_000_000),
+])
+def test_parse_amount_range(text, low, high):
+    amount = parse_amount_detail(text)
+    assert (amount.low, amount.high) == (pytest.approx(low), pytest.approx(high))
+    assert amount.value == pytest.approx((low + high) / 2)
+
+
+@pytest.mark.parametrize("text, period", [
+    ("50,000/month", "month"),
+    ("₹25K per month", "month"),
+    ("INR 2500 monthly", "month"),
+    ("₹6 L p.a.", "year"),
+    ("₹1.2 L per annum", "year"),
+    ("₹40 Lakh", None),
+])
+def test_parse_amount_period(text, period):
+    assert parse_amount_detail(text).period == period
+
+
+@pytest.mark.parametrize("text", [
+    None, True, "", "Not disclosed", "10 years", "Age 45", "2032", "5 properties", "12.5% returns", "Landmark 12",
+])
+def test_not_an_amount(text):
+    assert parse_amount(text) is None
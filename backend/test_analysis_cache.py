@@ -0,0 +1,43 @@
+import io
+from analysis_cache import analysis_key, hash_stream
+
+FILES = [("Statement.pdf", "application/pdf", "a" * 64), ("notes.png", "image/png", "b" * 64)]
+SETTINGS = {"pdf_min_page_chars": 200, "image_quality_profile": "standard"}
+
+
+def key(**overrides):
+    args = {"model_name": "gemini-2.5-pro", "file_hashes": FILES, "transcript": "Client wants a SIP",
+            "context_version": None, "input_settings": SETTINGS}
+    args.update(overrides)
+    return analysis_key(**args)
+
+
+def test_same_inputs_same_key():
+    assert key() == key()
+
+
+def test_key_normalizes_filename_case_and_transcript_whitespace():
+    files = [(name.upper(), content_type, digest) for name, content_type, digest in FILES]
+    assert key(file_hashes=files, transcript="  Client wants a SIP\n") == key()
+
+
+def test_key_changes_with_each_input():
+    base = key()
+    assert key(model_name="gpt-4o") != base
+    assert key(file_hashes=list(reversed(FILES))) != base
+    assert key(file_hashes=FILES[:1]) != base
+    assert key(transcript="Client wants an FD") != base
+    assert key(context_version="p1-v3") != base
+    assert key(input_settings={**SETTINGS, "image_quality_profile": "high"}) != base
+
+
+def test_missing_transcript_and_settings_match_empty():
+    assert key(transcript=None, input_settings=None) == key(transcript="", input_settings={})
+
+
+def test_hash_stream_rewinds():
+    stream = io.BytesIO(b"x" * (3 * 1024 * 1024 + 7))
+    stream.seek(100)
+    first = hash_stream(stream)
+    assert stream.tell() == 0
+    assert hash_stream(stream) == first
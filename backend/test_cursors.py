@@ -0,0 +1,45 @@
+import base64
+import datetime
+import pytest
+from fastapi import HTTPException
+from main import encode_cursor, decode_cursor
+
+
+@pytest.mark.parametrize("sort, last_value", [
+    ("updated_at", datetime.datetime(2026, 3, 14, 9, 26, 53, 589793)),
+    ("updated_at", datetime.datetime(2026, 3, 14, 9, 26, 53)),
+    ("name", "Asha Rao"),
+    ("name", ""),
+    ("name", "Zoë ₹ \"quoted\""),
+    ("id", 42),
+])
+def test_cursor_round_trip(sort, last_value):
+    assert decode_cursor(encode_cursor([last_value, 7]), sort) == (last_value, 7)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(["??>>~~" * 10, 1])
+    assert "+" not in cursor and "/" not in cursor
+
+
+def raw(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+@pytest.mark.parametrize("cursor, sort", [
+    ("not base64!", "name"),
+    (raw("not json"), "name"),
+    (raw('{"a": 1}'), "name"),
+    (raw('["Asha"]'), "name"),
+    (raw('["Asha", 1, 2]'), "name"),
+    (raw('["Asha", "1"]'), "name"),
+    (raw('["Asha", true]'), "name"),
+    (raw('[5, 1]'), "name"),
+    (raw('["5", 1]'), "id"),
+    (raw('["yesterday", 1]'), "updated_at"),
+    (raw('[null, 1]'), "updated_at"),
+])
+def test_bad_cursor_is_400(cursor, sort):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, sort)
+    assert error.value.status_code == 400
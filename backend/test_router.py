@@ -0,0 +1,119 @@
+import time
+import asyncio
+import pytest
+import router
+from router import ModelRouter
+
+SLOW = 0.5 # well past the hedge delay below
+
+
+@pytest.fixture(autouse=True)
+def chain(monkeypatch):
+    monkeypatch.setattr(router, "MODEL_FALLBACKS", {"a": ["b", "c"]})
+    monkeypatch.setattr(router, "HEDGE_AFTER", "0.02")
+    monkeypatch.setattr(router, "provider_for", lambda model: "fake")
+
+
+class FakePool:
+    """Provider pool whose models answer after a set delay, or fail."""
+
+    def __init__(self, delays=None, failing=()):
+        self.delays = delays or {}
+        self.failing = set(failing)
+        self.calls = []
+
+    def available(self, provider):
+        return True
+
+    async def _answer(self, model):
+        self.calls.append(model)
+        await asyncio.sleep(self.delays.get(model, 0))
+        if model in self.failing:
+            raise RuntimeError(f"{model} is down")
+
+    async def complete(self, model, context, message):
+        await self._answer(model)
+        return f"{model} reply"
+
+    async def stream(self, model, context, message):
+        await self._answer(model)
+        yield f"{model}-1"
+        yield f"{model}-2"
+
+
+def complete(model_router, model="a"):
+    return asyncio.run(model_router.complete(model, None, "hi"))
+
+
+def stream(model_router, model="a"):
+    async def collect():
+        return [delta async for delta in model_router.stream(model, None, "hi")]
+    return asyncio.run(collect())
+
+
+def test_fast_primary_is_used_alone():
+    pool = FakePool()
+    model_router = ModelRouter(pool)
+    assert complete(model_router) == ("a reply", "a")
+    assert pool.calls == ["a"]
+    assert (model_router.hedges, model_router.fallbacks) == (0, 0)
+
+
+def test_failed_primary_falls_back():
+    pool = FakePool(failing={"a"})
+    model_router = ModelRouter(pool)
+    assert complete(model_router) == ("b reply", "b")
+    assert pool.calls == ["a", "b"]
+    assert (model_router.hedges, model_router.fallbacks) == (0, 1)
+    assert model_router.health["a"].consecutive_failures == 1
+
+
+def test_slow_primary_is_hedged():
+    pool = FakePool(delays={"a": SLOW})
+    model_router = ModelRouter(pool)
+    assert complete(model_router) == ("b reply", "b")
+    assert (model_router.hedges, model_router.hedge_wins, model_router.fallbacks) == (1, 1, 0)
+    # The cancelled primary says nothing about its health
+    assert len(model_router.health["a"].samples) == 0
+
+
+def test_every_model_failing_raises_the_last_error():
+    model_router = ModelRouter(FakePool(failing={"a", "b", "c"}))
+    with pytest.raises(RuntimeError, match="c is down"):
+        complete(model_router)
+    assert model_router.fallbacks == 2
+
+
+def test_open_breaker_skips_the_model(monkeypatch):
+    monkeypatch.setattr(router, "BREAKER_FAILURES", 2)
+    pool = FakePool(failing={"a"})
+    model_router = ModelRouter(pool)
+    complete(model_router)
+    complete(model_router)
+    assert model_router.health["a"].state == "open"
+    pool.calls.clear()
+    assert complete(model_router) == ("b reply", "b")
+    assert pool.calls == ["b"]
+
+
+def test_stream_hedges_until_the_first_token():
+    model_router = ModelRouter(FakePool(delays={"a": SLOW}))
+    assert stream(model_router) == [("model", "b"), "b-1", "b-2"]
+    assert (model_router.hedges, model_router.hedge_wins) == (1, 1)
+
+
+def test_stream_falls_back_before_the_first_token():
+    model_router = ModelRouter(FakePool(failing={"a"}))
+    assert stream(model_router) == [("model", "b"), "b-1", "b-2"]
+    assert model_router.fallbacks == 1
+
+
+def test_losing_half_open_hedge_frees_its_trial():
+    pool = FakePool(delays={"a": 0.1, "b": SLOW})
+    model_router = ModelRouter(pool)
+    fallback = model_router._health("b")
+    fallback.opened_at = time.monotonic() - router.BREAKER_COOLDOWN - 1
+    assert stream(model_router) == [("model", "a"), "a-1", "a-2"]
+    assert pool.calls == ["a", "b"]
+    assert not fallback.trial_in_flight
+    assert fallback.state == "half_open"
@@ -0,0 +1,62 @@
+import pytest
+from versions import merge_patch, make_patch
+
+# RFC 7386 appendix A: (target, patch, result)
+RFC_7386_CASES = [
+    ({"a": "b"}, {"a": "c"}, {"a": "c"}),
+    ({"a": "b"}, {"b": "c"}, {"a": "b", "b": "c"}),
+    ({"a": "b"}, {"a": None}, {}),
+    ({"a": "b", "b": "c"}, {"a": None}, {"b": "c"}),
+    ({"a": ["b"]}, {"a": "c"}, {"a": "c"}),
+    ({"a": "c"}, {"a": ["b"]}, {"a": ["b"]}),
+    ({"a": {"b": "c"}}, {"a": {"b": "d", "c": None}}, {"a": {"b": "d"}}),
+    ({"a": [{"b": "c"}]}, {"a": [1]}, {"a": [1]}),
+    (["a", "b"], ["c", "d"], ["c", "d"]),
+    ({"a": "b"}, ["c"], ["c"]),
+    ({"a": "foo"}, None, None),
+    ({"a": "foo"}, "bar", "bar"),
+    ({"e": None}, {"a": 1}, {"e": None, "a": 1}),
+    ([1, 2], {"a": "b", "c": None}, {"a": "b"}),
+    ({}, {"a": {"bb": {"ccc": None}}}, {"a": {"bb": {}}}),
+]
+
+
+@pytest.mark.parametrize("target, patch, result", RFC_7386_CASES)
+def test_merge_patch_rfc_7386(target, patch, result):
+    assert merge_patch(target, patch) == result
+
+
+def test_merge_patch_leaves_inputs_untouched():
+    target, patch = {"a": {"b": [1]}}, {"a": {"c": [2]}}
+    merged = merge_patch(target, patch)
+    merged["a"]["c"].append(3)
+    assert target == {"a": {"b": [1]}}
+    assert patch == {"a": {"c": [2]}}
+
+
+@pytest.mark.parametrize("old, new", [
+    ({"name": "Asha", "age": 41}, {"name": "Asha", "age": 42}),
+    ({"name": "Asha", "city": "Pune"}, {"name": "Asha"}),
+    ({"assets": {"gold": "₹5 L"}}, {"assets": {"gold": "₹6 L", "fd": "₹2 L"}}),
+    ({"goals": ["home"]}, {"goals": ["home", "education"]}),
+    ({"a": {"b": {"c": 1}}}, {"a": 1}),
+    ({}, {"a": {"b": 1}}),
+])
+def test_make_patch_round_trip(old, new):
+    patch = make_patch(old, new)
+    assert patch is not None
+    assert merge_patch(old, patch) == new
+
+
+def test_make_patch_of_equal_documents_is_empty():
+    assert make_patch({"a": {"b": 1}}, {"a": {"b": 1}}) == {}
+
+
+@pytest.mark.parametrize("old, new", [
+    ({"a": 1}, {"a": None}),
+    ({"a": {"b": 1}}, {"a": {"b": None}}),
+    ({}, {"a": {"b": None}}),
+])
+def test_make_patch_refuses_explicit_nulls(old, new):
+    # A null in the patch would delete the key instead of storing null
+    assert make_patch(old, new) is None
@@ -0,0 +1,108 @@
+import os
+import json
+import copy
+from sqlalchemy.orm import Session
+from models import ClientProfile, ProfileVersion
+
+# Every Nth version is stored whole so rebuilding any version replays at most N-1 patches.
+PROFILE_SNAPSHOT_EVERY = int(os.getenv("PROFILE_SNAPSHOT_EVERY", "20"))
+
+_MISSING = object()
+
+
+class VersionNotFound(Exception):
+    pass
+
+
+# --- JSON Merge Patch (RFC 7386) ---
+def merge_patch(target, patch):
+    """Apply a merge patch: objects merge key by key, null deletes, anything else replaces."""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def make_patch(old, new):
+    """Smallest merge patch turning old into new, or None when it can't be expressed
+    (a value explicitly set to null looks like a deletion to RFC 7386)."""
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return None if _contains_null(new) else copy.deepcopy(new)
+    patch = {}
+    for key in old.keys() - new.keys():
+        patch[key] = None
+    for key, value in new.items():
+        previous = old.get(key, _MISSING)
+        if previous == value:
+            continue
+        if isinstance(previous, dict) and isinstance(value, dict):
+            sub = make_patch(previous, value)
+        elif _contains_null(value):
+            sub = None
+        else:
+            sub = copy.deepcopy(value)
+        if sub is None:
+            return None
+        patch[key] = sub
+    return patch
+
+
+def _contains_null(value) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, dict):
+        return any(_contains_null(v) for v in value.values())
+    return False
+
+
+# --- History ---
+def record_version(db: Session, profile: ClientProfile, old_data, new_data: dict, author_id=None) -> bool:
+    """Append a version row for a save; returns False (and records nothing) if the data is unchanged.
+
+    Profiles saved before history existed get their previous state recorded as version 1 first.
+    """
+    if old_data is not None and old_data == new_data:
+        return False
+    version = profile.version or 0
+    if version == 0 and old_data is not None:
+        version = 1
+        db.add(ProfileVersion(profile=profile, version=version, kind="snapshot", body=json.dumps(old_data)))
+    version += 1
+    patch = None
+    if old_data is not None and (version - 1) % PROFILE_SNAPSHOT_EVERY != 0:
+        patch = make_patch(old_data, new_data)
+    if patch is None:
+        db.add(ProfileVersion(profile=profile, version=version, kind="snapshot", body=json.dumps(new_data), author_id=author_id))
+    else:
+        db.add(ProfileVersion(profile=profile, version=version, kind="patch", body=json.dumps(patch), author_id=author_id))
+    profile.version = version
+    return True
+
+
+def load_version(db: Session, profile_id: int, version: int) -> dict:
+    """Rebuild a version from the nearest snapshot at or below it plus the patches after it."""
+    snapshot = (
+        db.query(ProfileVersion)
+        .filter(ProfileVersion.profile_id == profile_id, ProfileVersion.version <= version, ProfileVersion.kind == "snapshot")
+        .order_by(ProfileVersion.version.desc())
+        .first()
+    )
+    if snapshot is None:
+        raise VersionNotFound(version)
+    rows = (
+        db.query(ProfileVersion)
+        .filter(ProfileVersion.profile_id == profile_id, ProfileVersion.version > snapshot.version, ProfileVersion.version <= version)
+        .order_by(ProfileVersion.version)
+        .all()
+    )
+    if (rows[-1].version if rows else snapshot.version) != version:
+        raise VersionNotFound(version)
+    data = json.loads(snapshot.body)
+    for row in rows:
+        data = merge_patch(data, json.loads(row.body))
+    return data
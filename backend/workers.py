@@ -0,0 +1,60 @@
+import os
+import asyncio
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Shared by document and image preprocessing
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+
+# Imported by each worker as it starts, so the first upload doesn't pay for it
+WORKER_PRELOAD = ("pypdf", "PIL.Image", "PIL.ImageOps")
+
+
+def _warm_up(modules: tuple):
+    for name in modules:
+        importlib.import_module(name)
+    return os.getpid()
+
+
+class ProcessPool:
+    """Process pool for CPU-bound preprocessing (pypdf, Pillow) that would otherwise hold the GIL.
+
+    Workers are forked (spawn would re-import main.py when it is started as a script) and
+    started at startup, before provider clients open gRPC channels or threads.
+    """
+
+    def __init__(self, workers: int = PREPROCESS_WORKERS):
+        self.workers = workers
+        self.broken = 0
+        self._pool = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+        return self._pool
+
+    def start(self):
+        pool = self._executor()
+        for _ in range(self.workers):
+            pool.submit(_warm_up, WORKER_PRELOAD)
+
+    async def run(self, fn, *args):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+        except BrokenProcessPool:
+            # A crashed worker (e.g. out of memory on a hostile file) poisons the pool; start a fresh one next time
+            self.broken += 1
+            self.shutdown()
+            raise
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+preprocess_pool = ProcessPool()
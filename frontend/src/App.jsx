@@ -10,16 +10,27 @@ const API_BASE = window.location.hostname === 'localhost' || window.location.hos
   ? 'http://localhost:8000'
   : 'https://dash-etica-production.up.railway.app';
 
+const JOB_POLL_INTERVAL_MS = 1500;
+const STAGE_LABELS = {
+  queued: 'Waiting for an analysis worker...',
+  extracting: 'Reading your documents...',
+  uploading: 'Uploading files to the model...',
+  generating: 'Gemini is analyzing the client...',
+  parsing: 'Structuring the profile...',
+};
+
 function App() {
   const [loading, setLoading] = useState(false);
   const [analysisData, setAnalysisData] = useState(null);
   const [error, setError] = useState(null);
   const [profiles, setProfiles] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [currentProfileId, setCurrentProfileId] = useState(null);
   const [isSaving, setIsSaving] = useState(false);
   const [showHistory, setShowHistory] = useState(false);
   const [showUploader, setShowUploader] = useState(false);
   const [showAgent, setShowAgent] = useState(false);
+  const [analysisStage, setAnalysisStage] = useState(null);
 
   // Auth State
   const [token, setToken] = useState(localStorage.getItem('token'));
@@ -34,10 +45,14 @@ function App() {
     }
   }, [token]);
 
-  const fetchProfiles = async () => {
+  const fetchProfiles = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API_BASE}/profiles`);
-      setProfiles(response.data);
+      // Pages are keyset-paginated; the browser revalidates unchanged pages with ETags
+      const response = await axios.get(`${API_BASE}/profiles`, {
+        params: cursor ? { cursor } : {},
+      });
+      setProfiles(prev => (cursor ? [...prev, ...response.data] : response.data));
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (err) {
       if (err.response?.status === 401) {
         handleLogout();
@@ -61,6 +76,7 @@ function App() {
     delete axios.defaults.headers.common['Authorization'];
     setAnalysisData(null);
     setProfiles([]);
+    setNextCursor(null);
   };
 
   const handleFilesAnalysis = async (files = [], transcript = null) => {
@@ -76,14 +92,28 @@ function App() {
       formData.append('transcript', transcript);
     }
 
+    // Updating a saved profile: the model returns only the changes, merged on the server
     const url = currentProfileId
-      ? `${API_BASE}/analyze?profile_id=${currentProfileId}`
-      : `${API_BASE}/analyze`;
+      ? `${API_BASE}/analyze/jobs?profile_id=${currentProfileId}&incremental=true`
+      : `${API_BASE}/analyze/jobs`;
 
     try {
-      const response = await axios.post(url, formData, {
+      // Submit as a background job, then poll until the worker finishes
+      const submitted = await axios.post(url, formData, {
         headers: { 'Content-Type': 'multipart/form-data' },
       });
+      const jobId = submitted.data.job_id;
+      let job = submitted.data;
+      while (job.status === 'queued' || job.status === 'running') {
+        setAnalysisStage(job.stage || job.status);
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+        job = (await axios.get(`${API_BASE}/analyze/jobs/${jobId}`)).data;
+      }
+      if (job.status === 'failed') {
+        setError(job.error || 'Analysis failed. Please try again.');
+        return;
+      }
+      const response = await axios.get(`${API_BASE}/analyze/jobs/${jobId}/result`);
       setAnalysisData(response.data);
     } catch (err) {
       const detail = err.response?.data?.detail;
@@ -98,6 +128,7 @@ function App() {
       }
     } finally {
       setLoading(false);
+      setAnalysisStage(null);
     }
   };
 
@@ -110,8 +141,17 @@ function App() {
         name: name,
         data: analysisData
       });
-      setCurrentProfileId(response.data.id);
-      fetchProfiles();
+      const savedId = response.data.id;
+      setCurrentProfileId(savedId);
+      // Update the sidebar in place instead of re-fetching the whole book
+      const now = new Date().toISOString();
+      setProfiles(prev => {
+        const existing = prev.find(p => p.id === savedId);
+        const saved = existing
+          ? { ...existing, updated_at: now }
+          : { id: savedId, name, owner: username, created_at: now, updated_at: now };
+        return [saved, ...prev.filter(p => p.id !== savedId)];
+      });
       alert('Profile saved successfully!');
     } catch (err) {
       alert('Failed to save profile');
@@ -179,6 +219,14 @@ function App() {
                 <p className="text-[10px] text-slate-400 mt-1">{new Date(p.created_at).toLocaleDateString()}</p>
               </button>
             ))}
+            {nextCursor && (
+              <button
+                onClick={() => fetchProfiles(nextCursor)}
+                className="w-full py-2 text-xs font-semibold text-slate-400 hover:text-primary-600 transition-all"
+              >
+                Load more
+              </button>
+            )}
           </div>
 
           <button
@@ -292,7 +340,7 @@ function App() {
               <div className="bg-white p-8 rounded-3xl shadow-2xl border border-slate-100 flex flex-col items-center">
                 <Loader2 className="w-12 h-12 text-primary-600 animate-spin mb-4" />
                 <p className="font-bold text-slate-900 text-xl">Analyzing Data...</p>
-                <p className="text-slate-500 mt-2">Gemini 3 Flash is processing your request.</p>
+                <p className="text-slate-500 mt-2">{STAGE_LABELS[analysisStage] || 'Gemini 3 Flash is processing your request.'}</p>
               </div>
             </div>
           )}
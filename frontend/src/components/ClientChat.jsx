@@ -6,19 +6,19 @@ import {
     LayoutPanelLeft, Search, Clock,
     MessageCircle, Trash2, Globe, ShieldCheck
 } from 'lucide-react';
-import axios from 'axios';
 
 const WealthSyncWorkspace = ({ profileId, analysisData, clientName, onClose }) => {
     const [selectedModel, setSelectedModel] = useState('Gemini 3.1 Pro (Latest)');
     const [showModelMenu, setShowModelMenu] = useState(false);
-    const [messages, setMessages] = useState([
-        {
-            role: 'assistant',
-            content: `I've synchronized with ${clientName}'s financial profile. I have active analysis on their net worth, tax liabilities, and recent meeting transcripts. How can I assist you with this client today?`
-        }
-    ]);
+    const greeting = () => ({
+        role: 'assistant',
+        content: `I've synchronized with ${clientName}'s financial profile. I have active analysis on their net worth, tax liabilities, and recent meeting transcripts. How can I assist you with this client today?`
+    });
+    const [messages, setMessages] = useState(() => [greeting()]);
     const [input, setInput] = useState('');
     const [isLoading, setIsLoading] = useState(false);
+    // Server-side conversation; the backend keeps the history and summarizes older turns
+    const [sessionId, setSessionId] = useState(null);
     const messagesEndRef = useRef(null);
 
     const scrollToBottom = () => {
@@ -29,6 +29,12 @@ const WealthSyncWorkspace = ({ profileId, analysisData, clientName, onClose }) =
         scrollToBottom();
     }, [messages]);
 
+    // A session belongs to one client: start a new conversation when the selected client changes
+    useEffect(() => {
+        setSessionId(null);
+        setMessages([greeting()]);
+    }, [profileId]);
+
     const handleSend = async (e) => {
         e.preventDefault();
         if (!input.trim() || isLoading) return;
@@ -40,16 +46,71 @@ const WealthSyncWorkspace = ({ profileId, analysisData, clientName, onClose }) =
 
         try {
             const token = localStorage.getItem('token');
-            const response = await axios.post('http://localhost:8000/chat', {
-                profile_id: profileId,
-                context: profileId ? null : analysisData,
-                message: input,
-                model: selectedModel
-            }, {
-                headers: { Authorization: `Bearer ${token}` }
+            const response = await fetch('http://localhost:8000/chat/stream', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    Authorization: `Bearer ${token}`
+                },
+                body: JSON.stringify({
+                    profile_id: profileId,
+                    session_id: sessionId,
+                    context: profileId ? null : analysisData,
+                    message: input,
+                    model: selectedModel
+                })
             });
+            if (!response.ok || !response.body) {
+                throw new Error(`Chat stream failed with status ${response.status}`);
+            }
+
+            // Server-Sent Events: frames are separated by a blank line
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let started = false;
+
+            const appendDelta = (delta) => {
+                if (!started) {
+                    started = true;
+                    setIsLoading(false);
+                    setMessages(prev => [...prev, { role: 'assistant', content: delta }]);
+                    return;
+                }
+                setMessages(prev => {
+                    const next = [...prev];
+                    const last = next[next.length - 1];
+                    next[next.length - 1] = { ...last, content: last.content + delta };
+                    return next;
+                });
+            };
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const frame = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+
+                    let event = 'message';
+                    let data = '';
+                    frame.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) event = line.slice(6).trim();
+                        else if (line.startsWith('data:')) data += line.slice(5).trim();
+                    });
+                    if (!data) continue;
+
+                    const payload = JSON.parse(data);
+                    if (event === 'error') throw new Error(payload.detail);
+                    if (payload.delta) appendDelta(payload.delta);
+                    if (event === 'done' && payload.session_id) setSessionId(payload.session_id);
+                }
+            }
 
-            setMessages(prev => [...prev, { role: 'assistant', content: response.data.response }]);
+            if (!started) throw new Error('Empty response');
         } catch (error) {
             setMessages(prev => [...prev, {
                 role: 'assistant',
@@ -74,7 +135,7 @@ const WealthSyncWorkspace = ({ profileId, analysisData, clientName, onClose }) =
                     </div>
                 </div>
                 <div className="flex items-center gap-0.5">
-                    <SidebarAction icon={<Plus className="w-4 h-4" />} />
+                    <SidebarAction icon={<Plus className="w-4 h-4" />} onClick={() => { setSessionId(null); setMessages(prev => prev.slice(0, 1)); }} />
                     <SidebarAction icon={<Clock className="w-4 h-4" />} />
                     <SidebarAction icon={<MoreHorizontal className="w-4 h-4" />} />
                     <div className="w-[1px] h-4 bg-slate-200 mx-2" />
@@ -216,8 +277,8 @@ const WealthSyncWorkspace = ({ profileId, analysisData, clientName, onClose }) =
 };
 
 // Reusable Sub-components
-const SidebarAction = ({ icon }) => (
-    <button className="p-2 text-slate-400 hover:text-slate-900 hover:bg-slate-50 rounded-lg transition-all">
+const SidebarAction = ({ icon, onClick }) => (
+    <button onClick={onClick} className="p-2 text-slate-400 hover:text-slate-900 hover:bg-slate-50 rounded-lg transition-all">
         {icon}
     </button>
 );